@@ -1,7 +1,6 @@
 import sys
 
 from crossword import *
-from copy import deepcopy
 
 
 class CrosswordCreator():
@@ -11,11 +10,52 @@ class CrosswordCreator():
         Create new CSP crossword generate.
         """
         self.crossword = crossword
+
+        # Domains are bitsets over self.words: bit n set means the nth
+        # word is still possible. Words are sorted by length, so each
+        # length's words are a run of bits
+        self.words = sorted(self.crossword.words, key=lambda w: (len(w), w))
+        self.position = {word: n for n, word in enumerate(self.words)}
+        self.letters = sorted({letter for word in self.words
+                               for letter in word})
+        self.lengths = dict()
+        self.index = dict()
+        start = 0
+        while start < len(self.words):
+            length = len(self.words[start])
+            end = start
+            while end < len(self.words) and len(self.words[end]) == length:
+                end += 1
+            self.lengths[length] = bitset(range(end - start)) << start
+
+            # The words of this length with each letter at each position
+            for position in range(length):
+                places = dict()
+                for n in range(start, end):
+                    places.setdefault(self.words[n][position], []).append(
+                        n - start
+                    )
+                for letter, ns in places.items():
+                    self.index[length, position, letter] = bitset(ns) << start
+            start = end
+
         self.domains = {
-            var: self.crossword.words.copy()
+            var: (1 << len(self.words)) - 1
             for var in self.crossword.variables
         }
 
+    def values(self, domain):
+        """
+        Return the words in bitset `domain`, in order.
+        """
+        bits = bin(domain)[:1:-1]
+        values = []
+        n = bits.find("1")
+        while n != -1:
+            values.append(self.words[n])
+            n = bits.find("1", n + 1)
+        return values
+
     def letter_grid(self, assignment):
         """
         Return 2D array representing a given assignment.
@@ -100,11 +140,8 @@ class CrosswordCreator():
         (Remove any values that are inconsistent with a variable's unary
          constraints; in this case, the length of the word.)
         """
-        domain = deepcopy(self.domains)
-        for vars in domain.keys():
-            for vals in domain[vars]:
-                if vars.length != len(vals):
-                    self.domains[vars].remove(vals)
+        for var in self.domains:
+            self.domains[var] &= self.lengths.get(var.length, 0)
 
     def revise(self, x, y):
         """
@@ -115,19 +152,22 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
-        revised = False
-        remove = True
         overlap = self.crossword.overlaps[x, y]
-        domain = deepcopy(self.domains)
-        if overlap:
-            for i in domain[x]:
-                for j in domain[y]:
-                    if i[overlap[0]] == j[overlap[1]]:
-                        remove = False
-                if remove:
-                    self.domains[x].remove(i)
-                    revised = True
-        return revised
+        if not overlap:
+            return False
+        a, b = overlap
+
+        # Keep the words of x whose letter at the overlap some word of y
+        # still has there
+        allowed = 0
+        for letter in self.letters:
+            if self.domains[y] & self.index.get((y.length, b, letter), 0):
+                allowed |= self.index.get((x.length, a, letter), 0)
+        domain = self.domains[x] & allowed
+        if domain == self.domains[x]:
+            return False
+        self.domains[x] = domain
+        return True
 
     def ac3(self, arcs=None):
         """
@@ -148,7 +188,7 @@ class CrosswordCreator():
         while len(arcs) != 0:
             (a, b) = arcs.pop()
             if self.revise(a, b):
-                if len(self.domains[a]) == 0:
+                if self.domains[a] == 0:
                     return False
                 for n in self.crossword.neighbors(a):
                     if n == b:
@@ -187,20 +227,27 @@ class CrosswordCreator():
         The first value in the list, for example, should be the one
         that rules out the fewest values among the neighbors of `var`.
         """
-        l = []
-        assigned = []
-        for a in assignment.keys():
-            assigned.append(assignment[a])
-
+        # How many of each neighbor's words each letter at the overlap
+        # rules out
+        ruled_out = []
         for i in self.crossword.neighbors(var):
+            if i in assignment:
+                continue
             (a, b) = self.crossword.overlaps[var, i]
-            for j in self.domains[var]:
-                n = 0
-                for f in self.domains[i]:
-                    if j[a] != f[b] and f not in assigned:
-                        n += 1
-                d = (j, n)
-                l.append(d)
+            total = size(self.domains[i])
+            ruled_out.append((a, {
+                letter: total - size(
+                    self.domains[i] & self.index.get((i.length, b, letter), 0)
+                )
+                for letter in self.letters
+            }))
+
+        l = []
+        for j in self.values(self.domains[var]):
+            n = 0
+            for a, counts in ruled_out:
+                n += counts[j[a]]
+            l.append((j, n))
         l.sort(key=lambda x: x[1])
         a = []
         for k in l:
@@ -219,7 +266,7 @@ class CrosswordCreator():
         for i in self.crossword.variables:
             if i in assignment.keys():
                 continue
-            a.append((i, len(self.domains[i])))
+            a.append((i, size(self.domains[i])))
         a.sort(key=lambda x: x[1])
         b = [a[0]]
         for j in a:
@@ -251,12 +298,40 @@ class CrosswordCreator():
             new_assignment = assignment.copy()
             new_assignment[var] = val
             if self.consistent(new_assignment):
-                result = self.backtrack(new_assignment)
-                if result is not None:
-                    return result
+
+                # Narrow the neighbors' domains to fit val, undoing it if
+                # that leaves one empty or the search fails
+                domains = self.domains.copy()
+                self.domains[var] = 1 << self.position[val]
+                arcs = [(n, var) for n in self.crossword.neighbors(var)]
+                if self.ac3(arcs):
+                    result = self.backtrack(new_assignment)
+                    if result is not None:
+                        return result
+                self.domains = domains
         return None
 
 
+def bitset(ns):
+    """
+    Return a bitset with bits `ns` set.
+    """
+    ns = list(ns)
+    if not ns:
+        return 0
+    bits = bytearray(max(ns) // 8 + 1)
+    for n in ns:
+        bits[n >> 3] |= 1 << (n & 7)
+    return int.from_bytes(bits, "little")
+
+
+def size(domain):
+    """
+    Return the number of words in bitset `domain`.
+    """
+    return bin(domain).count("1")
+
+
 def main():
 
     # Check usage
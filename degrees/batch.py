@@ -0,0 +1,105 @@
+import json
+import multiprocessing
+import sys
+import time
+
+import degrees
+from degrees import load_data, people_named, shortest_path
+
+# Number of pairs handed to a worker at a time
+CHUNK_SIZE = 64
+
+
+def main():
+    if len(sys.argv) not in [2, 3, 4]:
+        sys.exit("Usage: python batch.py directory [pairs] [workers]")
+    directory = sys.argv[1]
+    filename = sys.argv[2] if len(sys.argv) >= 3 else "-"
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else None
+
+    # Load data once; forked workers share it copy-on-write
+    print("Loading data...", file=sys.stderr)
+    load_data(directory)
+    print("Data loaded.", file=sys.stderr)
+
+    f = sys.stdin if filename == "-" else open(filename, encoding="utf-8")
+    with f:
+        start = time.perf_counter()
+        count = 0
+        for record in answer_pairs(read_pairs(f), directory, workers):
+            print(json.dumps(record), flush=True)
+            count += 1
+        elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"{count} queries in {elapsed:.2f}s ({rate:.1f} queries/sec)",
+          file=sys.stderr)
+
+
+def read_pairs(f):
+    """
+    Yields (source, target) pairs from tab-separated lines of `f`,
+    skipping blank lines. Each side is a person id or a name.
+    """
+    for line in f:
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        source, _, target = line.partition("\t")
+        yield source.strip(), target.strip()
+
+
+def answer_pairs(pairs, directory, workers=None):
+    """
+    Answers every (source, target) pair on a pool of `workers` processes,
+    yielding result records in completion order.
+    """
+    # Forked workers inherit the loaded graph; otherwise each loads its own
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        initializer, initargs = None, ()
+    else:
+        context = multiprocessing.get_context()
+        initializer, initargs = load_data, (directory,)
+
+    with context.Pool(workers, initializer, initargs) as pool:
+        yield from pool.imap_unordered(answer, pairs, CHUNK_SIZE)
+
+
+def answer(pair):
+    """
+    Returns a JSON-ready record for the shortest path between a pair.
+    """
+    source, target = pair
+    record = {"source": source, "target": target}
+    source_id = resolve(source)
+    target_id = resolve(target)
+    if source_id is None or target_id is None:
+        record["error"] = "Person not found."
+        return record
+
+    path = shortest_path(source_id, target_id)
+    if path is None:
+        record["degrees"] = None
+        record["path"] = None
+    else:
+        record["degrees"] = len(path)
+        record["path"] = [list(step) for step in path]
+    return record
+
+
+def resolve(person):
+    """
+    Returns the person_id for a person id or an unambiguous name,
+    or None if there is no single match.
+    """
+    if person in degrees.person_index:
+        return person
+    matches = people_named(person)
+    if len(matches) != 1:
+        return None
+    return matches[0]
+
+
+if __name__ == "__main__":
+    main()
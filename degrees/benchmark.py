@@ -0,0 +1,118 @@
+import itertools
+import random
+import sys
+import time
+
+import degrees
+from degrees import breadth_first_path, build_graph, search_stats, shortest_path
+
+# Number of people in each synthetic graph
+SIZES = [1000, 10000, 100000]
+
+# Movies per person, and stars per movie, in each synthetic graph
+MOVIES_PER_PERSON = 0.5
+CAST_SIZE = 5
+
+# Largest graph the one-sided reference search is also timed on
+REFERENCE_LIMIT = 10000
+
+
+def main():
+    if len(sys.argv) not in [1, 2, 3]:
+        sys.exit("Usage: python benchmark.py [queries] [seed]")
+    queries = int(sys.argv[1]) if len(sys.argv) >= 2 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) == 3 else 0
+
+    print(f"{'search':<14}{'people':>8}{'p50 ms':>10}{'p90 ms':>10}"
+          f"{'p99 ms':>10}{'expanded':>10}{'peak':>8}{'scanned':>10}"
+          f"{'nbr ms':>8}")
+    for size in SIZES:
+        random.seed(seed)
+        generate_graph(size, int(size * MOVIES_PER_PERSON), CAST_SIZE)
+        pairs = sample_pairs(queries)
+        searches = [("bidirectional", shortest_path)]
+        if size <= REFERENCE_LIMIT:
+            searches.append(("one-sided", breadth_first_path))
+        for name, search in searches:
+            report(name, size, measure(search, pairs))
+
+
+def generate_graph(people, movies, cast):
+    """
+    Load a random bipartite graph of `people` and `movies`, each movie
+    starring `cast` people chosen with a heavy-tailed popularity, so a few
+    people appear in many movies like on IMDb.
+    """
+    weights = list(itertools.accumulate(
+        1 / (rank + 10) for rank in range(people)
+    ))
+    people_rows = [
+        (str(person), f"Person {person}", "") for person in range(people)
+    ]
+    movie_rows = [
+        (str(movie), f"Movie {movie}", "") for movie in range(movies)
+    ]
+    star_rows = [
+        (str(person), str(movie))
+        for movie in range(movies)
+        for person in random.choices(range(people), cum_weights=weights,
+                                     k=cast)
+    ]
+    build_graph(people_rows, movie_rows, star_rows)
+
+
+def sample_pairs(count):
+    """
+    Returns `count` random pairs of person_ids, chosen from people who
+    starred in at least one movie.
+    """
+    cast = [
+        person_id for person, person_id in enumerate(degrees.person_ids)
+        if degrees.person_offsets[person + 1] > degrees.person_offsets[person]
+    ]
+    return [(random.choice(cast), random.choice(cast)) for _ in range(count)]
+
+
+def measure(search, pairs):
+    """
+    Runs `search` on every pair, returning each query's latency in seconds
+    alongside a copy of its search counters.
+    """
+    results = []
+    for source, target in pairs:
+        start = time.perf_counter()
+        search(source, target)
+        elapsed = time.perf_counter() - start
+        results.append((elapsed, dict(search_stats)))
+    return results
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at `fraction` of the way through sorted `values`.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(name, size, results):
+    """
+    Prints latency percentiles and mean search counters for one run.
+    """
+    latencies = [elapsed * 1000 for elapsed, _ in results]
+
+    def mean(counter):
+        return sum(stats[counter] for _, stats in results) / len(results)
+
+    print(f"{name:<14}{size:>8}"
+          f"{percentile(latencies, 0.5):>10.3f}"
+          f"{percentile(latencies, 0.9):>10.3f}"
+          f"{percentile(latencies, 0.99):>10.3f}"
+          f"{mean('nodes_expanded'):>10.0f}"
+          f"{mean('frontier_peak'):>8.0f}"
+          f"{mean('neighbor_expansions'):>10.0f}"
+          f"{mean('neighbor_time') * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,604 @@
 import csv
+import heapq
+import json
+import math
+import mmap
+import os
 import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
 
-from util import Node, StackFrontier, QueueFrontier
+from util import Node
 
-# Maps names to a set of corresponding person_ids
-names = {}
+# Maps person_ids to their dense integer index, and back again
+person_index = {}
+person_ids = []
 
-# Maps person_ids to a dictionary of: name, birth, movies (a set of movie_ids)
-people = {}
+# Name and birth year of each person, by index
+person_names = []
+person_births = []
 
-# Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
-movies = {}
+# Maps movie_ids to their dense integer index, and back again
+movie_index = {}
+movie_ids = []
+
+# Title and year of each movie, by index
+movie_titles = []
+movie_years = []
+
+# Name index: person indexes ordered by lowercase name, binary searched by
+# lowercasing names as they are compared
+name_order = array("q")
+
+# Maps name trigrams to the positions in `name_order` of names containing
+# them, and counts the trigrams in each name; built the first time a fuzzy
+# lookup is made
+name_trigrams = {}
+name_trigram_sizes = array("H")
+
+# Minimum trigram similarity for a fuzzy name match
+SIMILARITY = 0.5
+
+# Compressed sparse row adjacency between people and movies: the movies of
+# person `p` are person_movies[person_offsets[p]:person_offsets[p + 1]], and
+# the stars of movie `m` are movie_stars[movie_offsets[m]:movie_offsets[m + 1]]
+person_offsets = array("q", [0])
+person_movies = array("q")
+movie_offsets = array("q", [0])
+movie_stars = array("q")
+
+# Binary snapshot of the parsed graph, written next to the CSV files
+SNAPSHOT = "degrees.snapshot"
+SNAPSHOT_MAGIC = b"DEGSNAP2"
+SOURCES = ("people.csv", "movies.csv", "stars.csv")
+
+# Keeps the memory map behind a loaded snapshot open
+snapshot = None
+
+# Landmark distance index: landmark_distances[k][p] is the degrees of
+# separation between person `p` and person landmarks[k], or UNREACHABLE
+LANDMARKS = "degrees.landmarks"
+LANDMARKS_MAGIC = b"DEGLMRK1"
+UNREACHABLE = 65535
+landmarks = array("q")
+landmark_distances = []
+
+# Number of landmarks consulted when pruning a search
+LANDMARK_ESTIMATES = 4
+
+# Counters for the most recent search: people expanded, the largest the
+# frontier grew, co-star entries scanned and seconds spent scanning them
+search_stats = {
+    "nodes_expanded": 0,
+    "frontier_peak": 0,
+    "neighbor_expansions": 0,
+    "neighbor_time": 0.0,
+}
 
 
 def load_data(directory):
     """
     Load data from CSV files into memory.
+
+    A snapshot of the parsed graph is saved in `directory` and mapped
+    straight back in on later runs, until any of the CSV files change.
+    A landmark index built for the same files is loaded too, if present.
     """
+    if load_snapshot(directory):
+        load_landmarks(directory)
+        return
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        for row in reader:
-            people[row["id"]] = {
-                "name": row["name"],
-                "birth": row["birth"],
-                "movies": set()
-            }
-            if row["name"].lower() not in names:
-                names[row["name"].lower()] = {row["id"]}
-            else:
-                names[row["name"].lower()].add(row["id"])
+        people_rows = [
+            (row["id"], row["name"], row["birth"]) for row in reader
+        ]
 
     # Load movies
     with open(f"{directory}/movies.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        for row in reader:
-            movies[row["id"]] = {
-                "title": row["title"],
-                "year": row["year"],
-                "stars": set()
-            }
+        movie_rows = [
+            (row["id"], row["title"], row["year"]) for row in reader
+        ]
 
     # Load stars
     with open(f"{directory}/stars.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                people[row["person_id"]]["movies"].add(row["movie_id"])
-                movies[row["movie_id"]]["stars"].add(row["person_id"])
-            except KeyError:
-                pass
+        build_graph(
+            people_rows, movie_rows,
+            ((row["person_id"], row["movie_id"]) for row in reader)
+        )
+
+    # Cache the parsed graph for next time
+    try:
+        save_snapshot(directory)
+    except OSError:
+        pass
+    load_landmarks(directory)
+
+
+def source_stamps(directory):
+    """
+    Returns the size and modification time of each CSV file in `directory`.
+    """
+    stamps = {}
+    for filename in SOURCES:
+        stat = os.stat(os.path.join(directory, filename))
+        stamps[filename] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def save_snapshot(directory):
+    """
+    Write the loaded graph to a snapshot file in `directory`.
+
+    The sections hold the CSR arrays, then the NUL-separated string
+    columns, each padded to 8 bytes.
+    """
+    arrays = {
+        "person_offsets": person_offsets,
+        "person_movies": person_movies,
+        "movie_offsets": movie_offsets,
+        "movie_stars": movie_stars,
+        "name_order": name_order,
+    }
+    strings = {
+        "person_ids": person_ids,
+        "person_names": person_names,
+        "person_births": person_births,
+        "movie_ids": movie_ids,
+        "movie_titles": movie_titles,
+        "movie_years": movie_years,
+    }
+
+    # Lay out every section, recording where it lands
+    sections = []
+    header = {
+        "sources": source_stamps(directory),
+        "arrays": {},
+        "strings": {},
+    }
+    position = 0
+    for name, values in arrays.items():
+        data = array("q", values).tobytes()
+        header["arrays"][name] = [position, len(values)]
+        sections.append(data)
+        position += len(data)
+    for name, values in strings.items():
+        data = "\0".join(values).encode("utf-8")
+        header["strings"][name] = [position, len(data), len(values)]
+        padding = -len(data) % 8
+        sections.append(data + bytes(padding))
+        position += len(data) + padding
+
+    write_mapped(os.path.join(directory, SNAPSHOT), SNAPSHOT_MAGIC,
+                 header, sections)
+
+
+def load_snapshot(directory):
+    """
+    Map the snapshot in `directory` into memory as the loaded graph.
+
+    Returns False, leaving the graph untouched, if there is no snapshot
+    or it is out of date with the CSV files.
+    """
+    global snapshot
+    global person_offsets, person_movies, movie_offsets, movie_stars
+
+    opened = open_mapped(os.path.join(directory, SNAPSHOT), SNAPSHOT_MAGIC,
+                         directory)
+    if opened is None:
+        return False
+    mapped, header, start = opened
+
+    # Integer arrays are used in place, straight from the map
+    view = memoryview(mapped)
+    arrays = {}
+    for name, (offset, count) in header["arrays"].items():
+        arrays[name] = view[start + offset:start + offset + 8 * count].cast("q")
+
+    # String columns are decoded into lists
+    strings = {}
+    for name, (offset, size, count) in header["strings"].items():
+        data = str(mapped[start + offset:start + offset + size], "utf-8")
+        strings[name] = data.split("\0") if count else []
+
+    snapshot = mapped
+    person_offsets = arrays["person_offsets"]
+    person_movies = arrays["person_movies"]
+    movie_offsets = arrays["movie_offsets"]
+    movie_stars = arrays["movie_stars"]
+    for name, values in strings.items():
+        globals()[name][:] = values
+
+    # Rebuild the lookup tables
+    person_index.clear()
+    movie_index.clear()
+    for person, person_id in enumerate(person_ids):
+        person_index[person_id] = person
+    for movie, movie_id in enumerate(movie_ids):
+        movie_index[movie_id] = movie
+    index_names(arrays["name_order"])
+    clear_landmarks()
+    return True
+
+
+def write_mapped(path, magic, header, sections):
+    """
+    Write a file of `magic` bytes, an 8-byte header length, the JSON
+    `header` and then the byte strings in `sections`.
+
+    The header is padded so the sections start on an 8-byte boundary,
+    and is stamped with the byte order of this machine.
+    """
+    header["byteorder"] = sys.byteorder
+    encoded = json.dumps(header).encode("utf-8")
+    encoded += b" " * (-(len(magic) + 8 + len(encoded)) % 8)
+
+    # Write to a temporary file first so readers never see a partial file
+    with open(path + ".tmp", "wb") as f:
+        f.write(magic)
+        f.write(len(encoded).to_bytes(8, "little"))
+        f.write(encoded)
+        for data in sections:
+            f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def open_mapped(path, magic, directory):
+    """
+    Map a file written by `write_mapped` into memory.
+
+    Returns (mapped, header, start), where `start` is the position of the
+    first section, or None if the file is missing, is not a `magic` file
+    or was built from CSV files in `directory` that have since changed.
+    """
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    # Check the file was built here, from the current CSV files
+    try:
+        if mapped[:len(magic)] != magic:
+            raise ValueError("wrong file type")
+        start = len(magic) + 8
+        length = int.from_bytes(mapped[len(magic):start], "little")
+        header = json.loads(mapped[start:start + length])
+        if (header["byteorder"] != sys.byteorder or
+                header["sources"] != source_stamps(directory)):
+            raise ValueError("stale file")
+    except (OSError, ValueError, KeyError):
+        mapped.close()
+        return None
+    return mapped, header, start + length
+
+
+def build_graph(people_rows, movie_rows, star_rows):
+    """
+    Replace the loaded graph with the given rows.
+
+    `people_rows` are (person_id, name, birth) tuples, `movie_rows` are
+    (movie_id, title, year) tuples and `star_rows` are (person_id, movie_id)
+    pairs. Stars naming an unknown person or movie are ignored.
+    """
+    global person_offsets, person_movies, movie_offsets, movie_stars
+
+    for table in (person_index, movie_index):
+        table.clear()
+    for column in (person_ids, person_names, person_births,
+                   movie_ids, movie_titles, movie_years):
+        column.clear()
+
+    # Intern people
+    for person_id, name, birth in people_rows:
+        if person_id in person_index:
+            continue
+        person = len(person_ids)
+        person_index[person_id] = person
+        person_ids.append(person_id)
+        person_names.append(name)
+        person_births.append(birth)
+
+    # Intern movies
+    for movie_id, title, year in movie_rows:
+        if movie_id in movie_index:
+            continue
+        movie_index[movie_id] = len(movie_ids)
+        movie_ids.append(movie_id)
+        movie_titles.append(title)
+        movie_years.append(year)
+
+    # Collect star edges as parallel integer arrays
+    sources = array("q")
+    targets = array("q")
+    for person_id, movie_id in star_rows:
+        try:
+            person = person_index[person_id]
+            movie = movie_index[movie_id]
+        except KeyError:
+            continue
+        sources.append(person)
+        targets.append(movie)
+
+    person_offsets, person_movies = adjacency(len(person_ids), sources, targets)
+    movie_offsets, movie_stars = adjacency(len(movie_ids), targets, sources)
+    index_names()
+    clear_landmarks()
+
+
+def adjacency(size, sources, targets):
+    """
+    Returns (offsets, indices) arrays in compressed sparse row form,
+    listing the distinct targets of each source in increasing order.
+    """
+    # Count edges per source, then turn counts into row offsets
+    offsets = array("q", [0]) * (size + 1)
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    # Scatter targets into their rows
+    indices = array("q", [0]) * len(sources)
+    fill = offsets[:-1]
+    for source, target in zip(sources, targets):
+        indices[fill[source]] = target
+        fill[source] += 1
+
+    # Sort each row and drop duplicate edges
+    unique_offsets = array("q", [0])
+    unique_indices = array("q")
+    for i in range(size):
+        unique_indices.extend(sorted(set(indices[offsets[i]:offsets[i + 1]])))
+        unique_offsets.append(len(unique_indices))
+    return unique_offsets, unique_indices
+
+
+def index_names(order=None):
+    """
+    Build the name index for the loaded people, given their `order`
+    by lowercase name if it is already known.
+    """
+    global name_order
+    if order is None:
+        order = array("q", sorted(range(len(person_names)), key=name_key))
+    name_order = order
+    name_trigrams.clear()
+    del name_trigram_sizes[:]
+
+
+def name_key(person):
+    """
+    Returns the lowercase name of a person index, which the name index is
+    ordered by.
+    """
+    return person_names[person].lower()
+
+
+def trigrams(name):
+    """
+    Returns the set of three-letter sequences in a lowercase name,
+    padded so that the start and end of words count too.
+    """
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def index_trigrams():
+    """
+    Build the trigram index over `name_order` used for fuzzy lookups.
+    """
+    postings = {}
+    sizes = array("H")
+    for position, person in enumerate(name_order):
+        grams = trigrams(name_key(person))
+        sizes.append(min(len(grams), 65535))
+        for trigram in grams:
+            postings.setdefault(trigram, []).append(position)
+    name_trigrams.clear()
+    for trigram, positions in postings.items():
+        name_trigrams[trigram] = array("i", positions)
+    name_trigram_sizes[:] = sizes
+
+
+def movie_count(person):
+    """
+    Returns the number of movies a person index starred in.
+    """
+    return person_offsets[person + 1] - person_offsets[person]
+
+
+def people_named(name):
+    """
+    Returns the person_ids of everyone with exactly `name`, ignoring case.
+    """
+    key = name.lower()
+    position = bisect_left(name_order, key, key=name_key)
+    matches = []
+    while (position < len(name_order)
+           and name_key(name_order[position]) == key):
+        matches.append(person_ids[name_order[position]])
+        position += 1
+    return matches
+
+
+def people_with_prefix(prefix, limit=10):
+    """
+    Returns the person_ids of up to `limit` people whose name starts with
+    `prefix`, ignoring case, most prolific first.
+    """
+    key = prefix.lower()
+    start = bisect_left(name_order, key, key=name_key)
+    end = bisect_left(name_order, key + chr(sys.maxunicode), start,
+                      key=name_key)
+    best = heapq.nlargest(
+        limit, (name_order[position] for position in range(start, end)),
+        key=movie_count
+    )
+    return [person_ids[person] for person in best]
+
+
+def people_like(name, limit=10):
+    """
+    Returns the person_ids of up to `limit` people whose name is similar to
+    `name`, ignoring case, best match first and then most prolific first.
+
+    Similarity is the Dice coefficient of the names' trigrams.
+    """
+    if not name_trigrams:
+        index_trigrams()
+
+    # Count the trigrams each indexed name shares with `name`
+    wanted = trigrams(name.lower())
+    shared = Counter()
+    for trigram in wanted:
+        shared.update(name_trigrams.get(trigram, ()))
+
+    # No name sharing fewer trigrams than this can be similar enough
+    least = SIMILARITY * len(wanted) / (2 - SIMILARITY)
+
+    scored = []
+    for position, count in shared.items():
+        if count < least:
+            continue
+        score = 2 * count / (len(wanted) + name_trigram_sizes[position])
+        if score >= SIMILARITY:
+            person = name_order[position]
+            scored.append((score, movie_count(person), person))
+    best = heapq.nlargest(limit, scored)
+    return [person_ids[person] for _, _, person in best]
+
+
+def build_landmarks(count):
+    """
+    Index the degrees of separation between everyone and the `count`
+    people who starred in the most movies.
+    """
+    global landmarks
+    ranked = sorted(
+        range(len(person_ids)),
+        key=lambda person: person_offsets[person + 1] - person_offsets[person],
+        reverse=True
+    )
+    landmarks = array("q", ranked[:count])
+    landmark_distances[:] = [distances_from(person) for person in landmarks]
+
+
+def distances_from(person):
+    """
+    Returns an array of the degrees of separation between `person` and
+    everyone else, found by breadth-first search.
+    """
+    distances = array("H", [UNREACHABLE]) * len(person_ids)
+    distances[person] = 0
+
+    # each movie only needs to be expanded the first time it is reached
+    seen_movies = bytearray(len(movie_ids))
+    frontier = [person]
+    depth = 0
+    while frontier and depth < UNREACHABLE - 1:
+        depth += 1
+        next_frontier = []
+        for person in frontier:
+            for i in range(person_offsets[person], person_offsets[person + 1]):
+                movie = person_movies[i]
+                if seen_movies[movie]:
+                    continue
+                seen_movies[movie] = 1
+                for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                    neighbor = movie_stars[j]
+                    if distances[neighbor] == UNREACHABLE:
+                        distances[neighbor] = depth
+                        next_frontier.append(neighbor)
+        frontier = next_frontier
+    return distances
+
+
+def save_landmarks(directory):
+    """
+    Write the landmark index to a file in `directory`.
+    """
+    header = {
+        "sources": source_stamps(directory),
+        "people": len(person_ids),
+        "landmarks": list(landmarks),
+    }
+    sections = [distances.tobytes() for distances in landmark_distances]
+    write_mapped(os.path.join(directory, LANDMARKS), LANDMARKS_MAGIC,
+                 header, sections)
+
+
+def load_landmarks(directory):
+    """
+    Map the landmark index in `directory` into memory.
+
+    Returns False, leaving no index loaded, if there is no index or it
+    is out of date with the CSV files.
+    """
+    global landmarks
+    clear_landmarks()
+    opened = open_mapped(os.path.join(directory, LANDMARKS), LANDMARKS_MAGIC,
+                         directory)
+    if opened is None:
+        return False
+    mapped, header, start = opened
+    if header["people"] != len(person_ids):
+        mapped.close()
+        return False
+
+    # Each landmark's distances are a section of 2-byte counts
+    size = 2 * header["people"]
+    view = memoryview(mapped)
+    landmarks = array("q", header["landmarks"])
+    for k in range(len(landmarks)):
+        section = start + k * size
+        landmark_distances.append(view[section:section + size].cast("H"))
+    return True
+
+
+def clear_landmarks():
+    """
+    Drop the landmark index, for when the graph it describes changes.
+    """
+    global landmarks
+    landmarks = array("q")
+    landmark_distances.clear()
+
+
+def distance_bounds(source, target):
+    """
+    Returns (lower, upper) bounds from the landmark index on the degrees
+    of separation between two person_ids.
+
+    Bounds are math.inf when the index shows the two are not connected,
+    and the upper bound is math.inf when no landmark reaches them.
+    """
+    return landmark_bounds(person_index[source], person_index[target])
+
+
+def landmark_bounds(source, target):
+    """
+    Returns (lower, upper) bounds on the degrees of separation between
+    two person indexes, by the triangle inequality through each landmark.
+    """
+    lower = 0
+    upper = math.inf
+    for distances in landmark_distances:
+        to_source = distances[source]
+        to_target = distances[target]
+        if to_source == UNREACHABLE or to_target == UNREACHABLE:
+            # a landmark reaching only one of them proves they are apart
+            if to_source != to_target:
+                return math.inf, math.inf
+            continue
+        lower = max(lower, abs(to_source - to_target))
+        upper = min(upper, to_source + to_target)
+    return lower, upper
 
 
 def main():
@@ -78,9 +627,9 @@ def main():
         print(f"{degrees} degrees of separation.")
         path = [(None, source)] + path
         for i in range(degrees):
-            person1 = people[path[i][1]]["name"]
-            person2 = people[path[i + 1][1]]["name"]
-            movie = movies[path[i + 1][0]]["title"]
+            person1 = person_names[person_index[path[i][1]]]
+            person2 = person_names[person_index[path[i + 1][1]]]
+            movie = movie_titles[movie_index[path[i + 1][0]]]
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
@@ -91,23 +640,204 @@ def shortest_path(source, target):
 
     If no possible path, returns None.
     """
+    reset_stats()
+    if source == target:
+        return []
+    source = person_index[source]
+    target = person_index[target]
+
+    # with a landmark index, rule out unconnected pairs and bound the search
+    upper = math.inf
+    if landmark_distances:
+        lower, upper = landmark_bounds(source, target)
+        if lower == math.inf:
+            return None
+
+    # parents map each reached person to the (movie, person) step
+    # that leads back towards the side's root
+    forward = {source: None}
+    backward = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+    forward_depth = 0
+    backward_depth = 0
+    forward_goal = landmark_goal(target)
+    backward_goal = landmark_goal(source)
+
+    while forward_frontier and backward_frontier:
+        search_stats["frontier_peak"] = max(
+            search_stats["frontier_peak"],
+            len(forward_frontier) + len(backward_frontier)
+        )
+
+        # always grow the side with the smaller frontier
+        start = time.perf_counter()
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_frontier, meeting = expand_frontier(
+                forward_frontier, forward, backward,
+                forward_goal, upper - forward_depth
+            )
+            forward_depth += 1
+        else:
+            backward_frontier, meeting = expand_frontier(
+                backward_frontier, backward, forward,
+                backward_goal, upper - backward_depth
+            )
+            backward_depth += 1
+        search_stats["neighbor_time"] += time.perf_counter() - start
+
+        # frontiers touched, so join the two halves of the path
+        if meeting is not None:
+            return join_paths(meeting, forward, backward)
+
+    # one side ran out of people to explore, so there is no connection
+    return None
+
+
+def reset_stats():
+    """
+    Zero the counters in `search_stats` ahead of a new search.
+    """
+    for counter in search_stats:
+        search_stats[counter] = 0
+    search_stats["neighbor_time"] = 0.0
+
+
+def landmark_goal(person):
+    """
+    Returns (distances, degrees) pairs for the landmarks that reach
+    `person`, most useful first, for estimating how far others are
+    from `person`.
+    """
+    goal = [
+        (distances, distances[person]) for distances in landmark_distances
+        if distances[person] != UNREACHABLE
+    ]
+
+    # nearby landmarks give the tightest estimates around `person`
+    goal.sort(key=lambda landmark: landmark[1])
+    return goal[:LANDMARK_ESTIMATES]
+
+
+def expand_frontier(frontier, parents, other_parents, goal=(), slack=math.inf):
+    """
+    Expands every person index in `frontier` by one level of co-stars,
+    recording new people in `parents`.
+
+    When `goal` landmarks are given, people in `frontier` that the
+    landmarks show are more than `slack` degrees from this side's goal
+    are not expanded, as no path within the upper bound passes through them.
+
+    Returns the next frontier and the person where this side met the
+    people already reached by `other_parents` (None if they have not met).
+    The whole level is expanded so the meeting point with the shortest
+    combined path is chosen.
+    """
+    if slack == math.inf:
+        goal = ()
+
+    next_frontier = []
+    meeting = None
+    best = None
+    expanded = 0
+    scanned = 0
+    for person in frontier:
+        if goal and too_far(person, goal, slack):
+            continue
+        expanded += 1
+        for i in range(person_offsets[person], person_offsets[person + 1]):
+            movie = person_movies[i]
+            scanned += movie_offsets[movie + 1] - movie_offsets[movie]
+            for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                neighbor = movie_stars[j]
+                if neighbor in parents:
+                    continue
+                parents[neighbor] = (movie, person)
+                next_frontier.append(neighbor)
+                if neighbor in other_parents:
+                    length = path_length(neighbor, other_parents)
+                    if best is None or length < best:
+                        best = length
+                        meeting = neighbor
+    search_stats["nodes_expanded"] += expanded
+    search_stats["neighbor_expansions"] += scanned
+    return next_frontier, meeting
+
+
+def too_far(person, goal, slack):
+    """
+    Returns True if any of the `goal` landmarks shows `person` is more
+    than `slack` degrees from the goal.
+    """
+    for distances, to_goal in goal:
+        if abs(distances[person] - to_goal) > slack:
+            return True
+    return False
+
+
+def path_length(person, parents):
+    """
+    Returns the number of steps from `person` back to the root
+    of the search tree described by `parents`.
+    """
+    length = 0
+    while parents[person] is not None:
+        person = parents[person][1]
+        length += 1
+    return length
+
+
+def join_paths(meeting, forward, backward):
+    """
+    Builds the (movie_id, person_id) path from the source to the target
+    through the person where both searches met.
+    """
+    # walk back from the meeting point to the source
+    path = []
+    person = meeting
+    while forward[person] is not None:
+        movie, parent = forward[person]
+        path.append((movie_ids[movie], person_ids[person]))
+        person = parent
+    path.reverse()
+
+    # walk on from the meeting point to the target
+    person = meeting
+    while backward[person] is not None:
+        movie, person = backward[person]
+        path.append((movie_ids[movie], person_ids[person]))
+    return path
+
+
+def breadth_first_path(source, target):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, using a one-sided
+    breadth-first search from the source.
+
+    Kept as a reference for `shortest_path`. If no possible path,
+    returns None.
+    """
+    reset_stats()
+
     # initial state
     start = Node(source, None, None)
     # initialize frontier
-    frontier = QueueFrontier()
-    # add initial state to frontier
-    frontier.add(start)
-    # create set for explored states
-    explored = set()
+    frontier = deque([start])
+    # create set for states already in or through the frontier
+    reached = {source}
 
     while True:
 
-        # if frontier is empty their is no connection 
-        if frontier.empty():
+        # if frontier is empty their is no connection
+        if not frontier:
             return None
+        search_stats["frontier_peak"] = max(
+            search_stats["frontier_peak"], len(frontier)
+        )
 
         # remove node from frontier
-        node = frontier.remove()
+        node = frontier.popleft()
 
         # if node is target their is a solution
         if node.state == target:
@@ -120,41 +850,52 @@ def shortest_path(source, target):
             actions.reverse()
             states.reverse()
             return list(zip(actions, states))
-        
-        # mark node as explored
-        explored.add(node)
-        
+
         # add neighbors to frontier
-        for action, state in neighbors_for_person(node.state):
-            if not frontier.contains_state(state) and state not in explored:
+        search_stats["nodes_expanded"] += 1
+        start = time.perf_counter()
+        neighbors = neighbors_for_person(node.state)
+        search_stats["neighbor_time"] += time.perf_counter() - start
+        search_stats["neighbor_expansions"] += len(neighbors)
+        for action, state in neighbors:
+            if state not in reached:
+                reached.add(state)
                 child = Node(state, node, action)
-                frontier.add(child)
+                frontier.append(child)
 
 
 def person_id_for_name(name):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    If nobody has that exact name, offers people whose name starts with
+    it or is spelled similarly instead.
     """
-    person_ids = list(names.get(name.lower(), set()))
-    if len(person_ids) == 0:
-        return None
-    elif len(person_ids) > 1:
+    matches = people_named(name)
+    if len(matches) == 1:
+        return matches[0]
+    elif len(matches) > 1:
         print(f"Which '{name}'?")
-        for person_id in person_ids:
-            person = people[person_id]
-            name = person["name"]
-            birth = person["birth"]
-            print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
-        try:
-            person_id = input("Intended Person ID: ")
-            if person_id in person_ids:
-                return person_id
-        except ValueError:
-            pass
-        return None
     else:
-        return person_ids[0]
+        # fall back to names that start with, or look like, the one given
+        matches = people_with_prefix(name) or people_like(name)
+        if len(matches) == 0:
+            return None
+        print(f"No '{name}' found. Did you mean:")
+
+    for person_id in matches:
+        person = person_index[person_id]
+        name = person_names[person]
+        birth = person_births[person]
+        print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
+    try:
+        person_id = input("Intended Person ID: ")
+        if person_id in matches:
+            return person_id
+    except ValueError:
+        pass
+    return None
 
 
 def neighbors_for_person(person_id):
@@ -162,11 +903,12 @@ def neighbors_for_person(person_id):
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
-    movie_ids = people[person_id]["movies"]
+    person = person_index[person_id]
     neighbors = set()
-    for movie_id in movie_ids:
-        for person_id in movies[movie_id]["stars"]:
-            neighbors.add((movie_id, person_id))
+    for i in range(person_offsets[person], person_offsets[person + 1]):
+        movie = person_movies[i]
+        for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+            neighbors.add((movie_ids[movie], person_ids[movie_stars[j]]))
     return neighbors
 
 
@@ -0,0 +1,93 @@
+import os
+import random
+import sys
+import time
+
+import degrees
+from degrees import (build_landmarks, clear_landmarks, load_data,
+                     load_landmarks, save_landmarks, shortest_path)
+
+# Default number of landmarks to index
+LANDMARKS = 16
+
+# Number of random connected pairs used to measure the speedup
+QUERIES = 200
+
+
+def main():
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python landmarks.py directory [landmarks]")
+    directory = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) == 3 else LANDMARKS
+
+    print("Loading data...")
+    load_data(directory)
+    print("Data loaded.")
+
+    # Build and save the index
+    start = time.perf_counter()
+    build_landmarks(count)
+    save_landmarks(directory)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(os.path.join(directory, degrees.LANDMARKS))
+    print(f"Indexed {len(degrees.landmarks)} landmarks in {elapsed:.2f}s "
+          f"({size / 2 ** 20:.1f} MiB)")
+
+    # Time the same queries with and without the index
+    pairs = sample_pairs(QUERIES)
+    if not pairs:
+        sys.exit("No connected pairs to measure.")
+    clear_landmarks()
+    without = time_queries(pairs)
+    load_landmarks(directory)
+    bounds = time_bounds(pairs)
+    with_index = time_queries(pairs)
+
+    print(f"Bidirectional search: {without / len(pairs) * 1000:.3f} ms/query")
+    print(f"Landmark search: {with_index / len(pairs) * 1000:.3f} ms/query "
+          f"({without / with_index:.1f}x)")
+    print(f"Distance bounds: {bounds / len(pairs) * 1000:.3f} ms/query "
+          f"({without / bounds:.1f}x)")
+
+
+def sample_pairs(count):
+    """
+    Returns up to `count` random pairs of person_ids that the landmark
+    index shows are connected, chosen from people who starred in a movie.
+    """
+    cast = [
+        person_id for person, person_id in enumerate(degrees.person_ids)
+        if degrees.person_offsets[person + 1] > degrees.person_offsets[person]
+    ]
+    pairs = []
+    for _ in range(10 * count):
+        if not cast or len(pairs) == count:
+            break
+        source, target = random.choice(cast), random.choice(cast)
+        if degrees.distance_bounds(source, target)[1] < float("inf"):
+            pairs.append((source, target))
+    return pairs
+
+
+def time_queries(pairs):
+    """
+    Returns the seconds taken to find the shortest path for every pair.
+    """
+    start = time.perf_counter()
+    for source, target in pairs:
+        shortest_path(source, target)
+    return time.perf_counter() - start
+
+
+def time_bounds(pairs):
+    """
+    Returns the seconds taken to look up distance bounds for every pair.
+    """
+    start = time.perf_counter()
+    for source, target in pairs:
+        degrees.distance_bounds(source, target)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
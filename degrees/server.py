@@ -0,0 +1,235 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import degrees
+from batch import answer
+from degrees import load_data, people_like, people_named, people_with_prefix
+
+HOST = "127.0.0.1"
+PORT = 8050
+
+# Number of recent request latencies kept for percentiles
+WINDOW = 1000
+
+# Default number of names returned by a lookup
+LIMIT = 10
+
+
+class Metrics():
+
+    def __init__(self):
+        """
+        Create empty request metrics.
+        """
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.latencies = deque(maxlen=WINDOW)
+
+    def report(self, workers):
+        """
+        Return the metrics as a JSON-ready dictionary.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(fraction * len(latencies)))
+            return round(latencies[index] * 1000, 3)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.queued - workers),
+            "workers": workers,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p90": percentile(0.9),
+                "p99": percentile(0.99),
+            },
+        }
+
+
+class Server():
+
+    def __init__(self, directory, workers):
+        """
+        Create a server answering queries about the graph in `directory`,
+        with searches run on a pool of `workers` processes.
+
+        The graph must already be loaded; forked workers share it.
+        """
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            initializer, initargs = None, ()
+        else:
+            context = multiprocessing.get_context()
+            initializer, initargs = prepare, (directory,)
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(
+            workers, context, initializer, initargs
+        )
+        self.metrics = Metrics()
+
+    async def search(self, function, *args):
+        """
+        Run a CPU-heavy `function` on the worker pool.
+        """
+        self.metrics.queued += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, function, *args)
+        finally:
+            self.metrics.queued -= 1
+
+    async def handle(self, reader, writer):
+        """
+        Answer one HTTP request on a connection.
+        """
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        self.metrics.in_flight += 1
+        try:
+            status, body = await self.route(reader)
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+        finally:
+            self.metrics.in_flight -= 1
+        if status >= 400:
+            self.metrics.errors += 1
+
+        data = json.dumps(body).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                  405: "Method Not Allowed"}.get(status, "Error")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode("ascii") + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+        self.metrics.latencies.append(time.perf_counter() - start)
+
+    async def route(self, reader):
+        """
+        Read a request and return its (status, body) response.
+        """
+        request = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        try:
+            method, target, _ = request.decode("latin-1").split()
+        except ValueError:
+            return 400, {"error": "Malformed request."}
+        if method != "GET":
+            return 405, {"error": "Only GET is supported."}
+
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/path":
+            if "source" not in query or "target" not in query:
+                return 400, {"error": "Give a source and a target."}
+            record = await self.search(
+                answer, (query["source"], query["target"])
+            )
+            return (404 if "error" in record else 200), record
+        elif url.path == "/names":
+            if "q" not in query:
+                return 400, {"error": "Give a name to look up."}
+            limit = query.get("limit", str(LIMIT))
+            if not (limit.isascii() and limit.isdigit()):
+                return 400, {"error": "Limit must be a whole number."}
+            return 200, await self.lookup(query["q"], int(limit))
+        elif url.path == "/metrics":
+            return 200, self.metrics.report(self.workers)
+        return 404, {"error": "No such endpoint."}
+
+    async def lookup(self, name, limit):
+        """
+        Return exact, prefix and, failing those, fuzzy matches for `name`.
+        """
+        # A short prefix can match a large share of all names, and fuzzy
+        # matching scans the trigram index, so both run on the pool
+        matches = {
+            "exact": people_named(name),
+            "prefix": await self.search(people_with_prefix, name, limit),
+            "fuzzy": [],
+        }
+        if not matches["exact"] and not matches["prefix"]:
+            matches["fuzzy"] = await self.search(people_like, name, limit)
+
+        return {
+            kind: [describe(person_id) for person_id in person_ids]
+            for kind, person_ids in matches.items()
+        }
+
+    async def serve(self, host, port):
+        """
+        Serve requests on `host`:`port` until cancelled.
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown()
+
+
+def prepare(directory):
+    """
+    Load data from `directory` and build the trigram index, in a worker
+    that cannot share them with the server by forking.
+    """
+    load_data(directory)
+    degrees.index_trigrams()
+
+
+def describe(person_id):
+    """
+    Returns a JSON-ready description of a person.
+    """
+    person = degrees.person_index[person_id]
+    return {
+        "id": person_id,
+        "name": degrees.person_names[person],
+        "birth": degrees.person_births[person],
+        "movies": degrees.movie_count(person),
+    }
+
+
+def main():
+    if len(sys.argv) not in [2, 3, 4]:
+        sys.exit("Usage: python server.py directory [port] [workers]")
+    directory = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) >= 3 else PORT
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else os.cpu_count()
+
+    # Load data and build the trigram index once, before the workers fork,
+    # so they share one copy
+    print("Loading data...")
+    load_data(directory)
+    degrees.index_trigrams()
+    print("Data loaded.")
+
+    try:
+        asyncio.run(Server(directory, workers).serve(HOST, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from heredity import JunctionTree, family_structure, infer, load_data
+
+# Number of files handed to a worker at a time
+CHUNK_SIZE = 16
+
+# Number of planned junction trees each worker keeps
+TREES = 256
+
+# Junction trees planned by this process, by family structure
+trees = OrderedDict()
+
+
+def main():
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python batch.py directory|pattern [workers]")
+    workers = int(sys.argv[2]) if len(sys.argv) == 3 else None
+    filenames = find_families(sys.argv[1])
+
+    start = time.perf_counter()
+    count = 0
+    for record in answer_families(filenames, workers):
+        print(json.dumps(record), flush=True)
+        count += 1
+    elapsed = time.perf_counter() - start
+
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"{count} families in {elapsed:.2f}s ({rate:.1f} families/sec)",
+          file=sys.stderr)
+
+
+def find_families(source):
+    """
+    Returns the CSV files in directory `source`, or else the files
+    matching `source` as a glob pattern, in sorted order.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            entry.path for entry in os.scandir(source)
+            if entry.name.endswith(".csv") and entry.is_file()
+        )
+    return sorted(glob.glob(source, recursive=True))
+
+
+def answer_families(filenames, workers=None):
+    """
+    Answers every family file on a pool of `workers` processes, yielding
+    result records in completion order.
+    """
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(answer, filenames, CHUNK_SIZE)
+
+
+def answer(filename):
+    """
+    Returns a JSON-ready record of every person's gene and trait
+    probabilities in a family file.
+    """
+    record = {"file": filename}
+    try:
+        people = load_data(filename)
+        record["people"] = infer(people, plan(people))
+    except (OSError, KeyError, ValueError, ZeroDivisionError) as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def plan(people):
+    """
+    Returns a junction tree for `people`, reusing one planned for an
+    earlier family of the same structure when possible.
+    """
+    structure = family_structure(people)
+    if structure in trees:
+        trees.move_to_end(structure)
+    else:
+        trees[structure] = JunctionTree(people)
+        if len(trees) > TREES:
+            trees.popitem(last=False)
+    return trees[structure]
+
+
+if __name__ == "__main__":
+    main()
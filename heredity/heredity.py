@@ -1,6 +1,12 @@
 import csv
+import heapq
 import itertools
+import math
+import multiprocessing
 import sys
+import time
+
+import numpy as np
 
 PROBS = {
 
@@ -36,14 +42,70 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Gene assignments evaluated at a time by `enumerate_batched`
+BLOCK = 1 << 16
+
+# Sampling methods, and the default samples and chains for them
+METHODS = ["exact", "weighting", "gibbs"]
+SAMPLES = 10000
+CHAINS = 4
+
+# Particles drawn at a time by likelihood weighting
+PARTICLES = 4096
+
+# Fraction of each Gibbs chain discarded while it warms up
+BURN_IN = 0.1
+
 
 def main():
 
     # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
+    if len(sys.argv) not in [2, 3, 4, 5]:
+        sys.exit("Usage: python heredity.py data.csv "
+                 "[exact|weighting|gibbs] [samples|seconds s] [chains]")
     people = load_data(sys.argv[1])
+    method = sys.argv[2] if len(sys.argv) >= 3 else "exact"
+    if method not in METHODS:
+        sys.exit(f"Method must be one of {', '.join(METHODS)}.")
+
+    # Compute gene and trait probabilities for each person
+    if method == "exact":
+        probabilities = infer(people)
+    else:
+        budget = sys.argv[3] if len(sys.argv) >= 4 else str(SAMPLES)
+        chains = int(sys.argv[4]) if len(sys.argv) == 5 else CHAINS
+        if chains < 1:
+            sys.exit("Usage: python heredity.py data.csv "
+                     "[exact|weighting|gibbs] [samples|seconds s] [chains]"
+                     "\nChains must be at least 1.")
+        if budget.endswith("s"):
+            samples, seconds = None, float(budget[:-1])
+        else:
+            samples, seconds = int(budget), None
+        probabilities, diagnostics = sample_probabilities(
+            people, method, samples, seconds, chains
+        )
+        for key, value in diagnostics.items():
+            print(f"{key}: {value}", file=sys.stderr)
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
 
+
+def enumerate_probabilities(people):
+    """
+    Return gene and trait probabilities for each person by enumerating
+    every assignment of genes and traits to everyone.
+
+    This takes time exponential in the number of people; `infer` gives
+    the same answers using the structure of the family.
+    """
     # Keep track of gene and trait probabilities for each person
     probabilities = {
         person: {
@@ -60,38 +122,83 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
+    # Loop over every assignment of traits that fits the known traits,
+    # and every assignment of gene counts
+    family = compile_family(people)
+    known = [(0, 1) if trait is None else (trait,) for trait in family.traits]
+    for traits in itertools.product(*known):
+        for genes in itertools.product(range(3), repeat=len(family.names)):
 
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
+            # Update probabilities with new joint probability
+            p = family.probability(genes, traits)
+            for name, x, trait in zip(family.names, genes, traits):
+                probabilities[name]["gene"][x] += p
+                probabilities[name]["trait"][trait == 1] += p
 
     # Ensure probabilities sum to 1
     normalize(probabilities)
+    return probabilities
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+
+def enumerate_batched(people, block=BLOCK):
+    """
+    Return the same probabilities as `enumerate_probabilities`, computing
+    the joint probabilities of `block` gene assignments at a time with
+    NumPy.
+
+    Assignment k gives person i the i-th base 3 digit of k copies of the
+    gene. Unknown traits are summed out exactly per assignment rather
+    than enumerated, since each depends only on its person's genes.
+    """
+    family = compile_family(people)
+    n = len(family.names)
+    founder_table = np.array(family.founder_table)
+    child_table = np.array(family.child_table)
+    trait_table = np.array(family.trait_table)
+    powers = 3 ** np.arange(n, dtype=np.int64)
+
+    genes_total = np.zeros((n, 3))
+    traits_total = np.zeros(n)
+    for start in range(0, 3 ** n, block):
+        assignments = np.arange(start, min(3 ** n, start + block))
+        genes = assignments[np.newaxis, :] // powers[:, np.newaxis] % 3
+
+        # Joint probability of each assignment with the known traits
+        p = np.ones(len(assignments))
+        for i in range(n):
+            mother = family.mothers[i]
+            if mother < 0:
+                p *= founder_table[genes[i]]
+            else:
+                p *= child_table[9 * genes[mother]
+                                 + 3 * genes[family.fathers[i]] + genes[i]]
+            if family.traits[i] is not None:
+                p *= trait_table[genes[i], family.traits[i]]
+
+        # Accumulate each person's gene and trait distributions
+        for i in range(n):
+            genes_total[i] += np.bincount(genes[i], weights=p, minlength=3)
+            if family.traits[i] is None:
+                traits_total[i] += (p * trait_table[genes[i], 1]).sum()
+            elif family.traits[i]:
+                traits_total[i] += p.sum()
+
+    probabilities = dict()
+    for i, name in enumerate(family.names):
+        total = genes_total[i].sum()
+        has_trait = traits_total[i] / total
+        probabilities[name] = {
+            "gene": {
+                2: genes_total[i][2] / total,
+                1: genes_total[i][1] / total,
+                0: genes_total[i][0] / total
+            },
+            "trait": {
+                True: has_trait,
+                False: 1 - has_trait
+            }
+        }
+    return probabilities
 
 
 def load_data(filename):
@@ -139,69 +246,119 @@ def joint_probability(people, one_gene, two_genes, have_trait):
         * everyone in set `have_trait` has the trait, and
         * everyone not in set` have_trait` does not have the trait.
     """
-    # create empty data structures
-    zero_copy = []
-    probabs = []
-    parent_probs = {}
-
-    for a in people.keys():
-        # add person to zero_copy list if person is not in one_gene or two_genes
-        if (a not in one_gene) and (a not in two_genes):
-            zero_copy.append(a)
-
-        # add parent:probability of passing gene to child to parent_prob dictionary 
-        for c in people.keys():
-            if a == people[c]['mother'] or a == people[c]['father']:
-                if a not in one_gene and a not in two_genes:
-                    parent_probs[a] = PROBS['mutation']
-                elif a in one_gene:
-                    parent_probs[a] = (0.5 * PROBS['mutation']) + (0.5 * (1 - PROBS['mutation']))
-                elif a in two_genes:
-                    parent_probs[a] = 1 - PROBS['mutation'] 
-
-    for b in people.keys():
-        # if no parent listed for person
-        if (people[b]['mother'] == None) and (people[b]['father'] == None):
-            if b in zero_copy:
-                x = 0
-            elif b in one_gene:
-                x = 1
-            elif b in two_genes:
-                x = 2
-            # probability of having 'x' number of genes
-            prob_copy = PROBS['gene'][x]
-            # probability of having trait based on number of genes
-            if b in have_trait:
-                prob_trait = PROBS['trait'][x][True]
+    family = compile_family(people)
+    genes = [
+        1 if name in one_gene else 2 if name in two_genes else 0
+        for name in family.names
+    ]
+    traits = [1 if name in have_trait else 0 for name in family.names]
+    return family.probability(genes, traits)
+
+
+class Family():
+
+    def __init__(self, people):
+        """
+        Compile the family in `people` for fast joint probabilities.
+
+        People are numbered in the order they were loaded, and each has
+        their parents' numbers (-1 if unknown) and a table of gene
+        probabilities: indexed by their own gene count if they have no
+        parents, or else by 9 * mother's + 3 * father's + their own.
+        """
+        self.names = list(people)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.mothers = []
+        self.fathers = []
+        self.gene_tables = []
+        self.traits = []
+
+        self.founder_table = [PROBS["gene"][x] for x in range(3)]
+        self.child_table = [
+            child_probability(x, mother, father)
+            for mother in range(3)
+            for father in range(3)
+            for x in range(3)
+        ]
+        for name in self.names:
+            person = people[name]
+            if person["mother"] is None:
+                self.mothers.append(-1)
+                self.fathers.append(-1)
+                self.gene_tables.append(self.founder_table)
             else:
-                prob_trait = PROBS['trait'][x][False]
-        # if parent is listed of person
-        else:
-            mom = people[b]['mother']
-            dad = people[b]['father']
-            # probability of having gene based on number of parent gene 
-            if b in zero_copy:
-                x = 0
-                prob_copy = (1 - parent_probs[mom]) * (1 - parent_probs[dad])
-            elif b in one_gene:
-                x = 1
-                prob_copy = ((parent_probs[mom]) * (1 - parent_probs[dad])) + ((1 - parent_probs[mom]) * parent_probs[dad])
-            elif b in two_genes:
-                x = 2
-                prob_copy = parent_probs[mom] * parent_probs[dad]
-            # probability of having trait based on number of gene
-            if b in have_trait:
-                prob_trait = PROBS['trait'][x][True]
+                self.mothers.append(self.index[person["mother"]])
+                self.fathers.append(self.index[person["father"]])
+                self.gene_tables.append(self.child_table)
+            self.traits.append(
+                None if person["trait"] is None else int(person["trait"])
+            )
+
+        # Probability of the trait (indexed 0 or 1) given each gene count
+        self.trait_table = [
+            [PROBS["trait"][x][False], PROBS["trait"][x][True]]
+            for x in range(3)
+        ]
+
+        # Parents come before their children in `order`
+        self.order = []
+        placed = [False] * len(self.names)
+        for i in range(len(self.names)):
+            stack = [i]
+            while stack:
+                j = stack[-1]
+                parents = [
+                    parent for parent in (self.mothers[j], self.fathers[j])
+                    if parent >= 0 and not placed[parent]
+                ]
+                if parents:
+                    stack.extend(parents)
+                    continue
+                stack.pop()
+                if not placed[j]:
+                    placed[j] = True
+                    self.order.append(j)
+
+    def probability(self, genes, traits):
+        """
+        Return the joint probability that each person `i` has `genes[i]`
+        copies of the gene and, if `traits[i]` is 1, the trait.
+        """
+        p = 1
+        for i, table in enumerate(self.gene_tables):
+            x = genes[i]
+            mother = self.mothers[i]
+            if mother < 0:
+                gene = table[x]
             else:
-                prob_trait = PROBS['trait'][x][False]
-            
-        probabs.append(prob_copy * prob_trait)
-    
-    z = 1
-    for p in probabs:
-        z *= p
-    
-    return z
+                gene = table[9 * genes[mother] + 3 * genes[self.fathers[i]]
+                             + x]
+            p *= gene * self.trait_table[x][traits[i]]
+        return p
+
+
+# Family most recently compiled by `compile_family`, and its key
+compiled = (None, None)
+
+
+def compile_family(people):
+    """
+    Return the compiled Family for `people`, reusing the last one compiled
+    if it was for people with the same names, parents and traits.
+
+    The cache is keyed on what the Family is compiled from rather than on
+    the `people` dictionary itself, so editing the dictionary in place
+    recompiles it, and the dictionary is not kept alive.
+    """
+    global compiled
+    key = (
+        tuple(people),
+        family_structure(people),
+        tuple(person["trait"] for person in people.values()),
+    )
+    if compiled[0] != key:
+        compiled = (key, Family(people))
+    return compiled[1]
 
 
 def update(probabilities, one_gene, two_genes, have_trait, p):
@@ -246,5 +403,601 @@ def normalize(probabilities):
         probabilities[person]['trait'][False] = probabilities[person]['trait'][False] * d
 
 
+def assignments(scope):
+    """
+    Yield every assignment of gene counts to the people in `scope`, as
+    dictionaries, with the last person's count changing fastest.
+    """
+    for genes in itertools.product(range(3), repeat=len(scope)):
+        yield dict(zip(scope, genes))
+
+
+def inherit_probability(genes):
+    """
+    Return the probability that a parent with `genes` copies of the gene
+    passes it on to a child.
+    """
+    if genes == 0:
+        return PROBS["mutation"]
+    elif genes == 1:
+        return 0.5 * PROBS["mutation"] + 0.5 * (1 - PROBS["mutation"])
+    return 1 - PROBS["mutation"]
+
+
+def child_probability(genes, mother, father):
+    """
+    Return the probability that a child has `genes` copies of the gene
+    when their parents have `mother` and `father` copies.
+    """
+    from_mother = inherit_probability(mother)
+    from_father = inherit_probability(father)
+    if genes == 0:
+        return (1 - from_mother) * (1 - from_father)
+    elif genes == 1:
+        return (from_mother * (1 - from_father)
+                + (1 - from_mother) * from_father)
+    return from_mother * from_father
+
+
+def person_table(people, person):
+    """
+    Return the probability of each gene count for `person` given their
+    parents' gene counts, times the probability of their trait if it is
+    known, for every assignment to (mother, father, person) in the order
+    of `assignments`, or to (person,) if their parents are unknown.
+    """
+    mother = people[person]["mother"]
+    father = people[person]["father"]
+    trait = people[person]["trait"]
+    scope = (person,) if mother is None else (mother, father, person)
+
+    values = []
+    for genes in assignments(scope):
+        x = genes[person]
+        if mother is None:
+            p = PROBS["gene"][x]
+        else:
+            p = child_probability(x, genes[mother], genes[father])
+        if trait is not None:
+            p *= PROBS["trait"][x][trait]
+        values.append(p)
+    return values
+
+
+def moral_graph(people):
+    """
+    Return a dictionary mapping each person to the set of people their
+    gene count directly interacts with: their parents, their children,
+    and the other parents of their children.
+    """
+    relatives = {person: set() for person in people}
+    for person in people:
+        parents = [
+            parent for parent in (people[person]["mother"],
+                                  people[person]["father"])
+            if parent is not None
+        ]
+        for a in parents + [person]:
+            for b in parents + [person]:
+                if a != b:
+                    relatives[a].add(b)
+    return relatives
+
+
+def elimination_order(people):
+    """
+    Return an order in which to eliminate people's gene counts, always
+    choosing someone with the fewest relatives left in the moralized
+    family graph, so the factors built along the way stay small.
+    """
+    relatives = moral_graph(people)
+    heap = [(len(relatives[person]), person) for person in people]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        degree, person = heapq.heappop(heap)
+        if person not in relatives or degree != len(relatives[person]):
+            continue
+        order.append(person)
+
+        # Eliminating a person links all their remaining relatives
+        remaining = relatives.pop(person)
+        for relative in remaining:
+            relatives[relative].discard(person)
+            relatives[relative].update(remaining - {relative})
+            heapq.heappush(heap, (len(relatives[relative]), relative))
+    return order
+
+
+def family_structure(people):
+    """
+    Return the shape of the family in `people`: each person's parents as
+    positions in load order, or None. Families with the same structure
+    can share a JunctionTree.
+    """
+    index = {name: i for i, name in enumerate(people)}
+    return tuple(
+        None if person["mother"] is None
+        else (index[person["mother"]], index[person["father"]])
+        for person in people.values()
+    )
+
+
+class JunctionTree():
+
+    def __init__(self, people):
+        """
+        Plan exact inference for families shaped like `people`.
+
+        People are eliminated one at a time; each elimination multiplies
+        the factors involving that person into a cluster and sums the
+        person out to give a message for a later cluster. The plan records,
+        for every assignment to each cluster, where to find its value in
+        each factor multiplied in and in the message sent on. People are
+        referred to by position, so the plan fits any family with the
+        same `family_structure`.
+        """
+        position = {name: i for i, name in enumerate(people)}
+        structure = family_structure(people)
+        self.size = len(structure)
+
+        # Factor i < size is person i's own table
+        scopes = {}
+        involving = [set() for _ in range(self.size)]
+        for i, parents in enumerate(structure):
+            scopes[i] = (i,) if parents is None else parents + (i,)
+            for j in scopes[i]:
+                involving[j].add(i)
+
+        # Simulate elimination to find each cluster's scope and lookups
+        self.clusters = []
+        self.parents = []
+        sent_by = {}
+        for name in elimination_order(people):
+            person = position[name]
+            used = sorted(involving[person])
+            involving[person] = set()
+            scope = []
+            for i in used:
+                scope.extend(j for j in scopes[i] if j not in scope)
+                for j in scopes[i]:
+                    if j != person:
+                        involving[j].discard(i)
+                if i in sent_by:
+                    self.parents[sent_by[i]] = len(self.clusters)
+            kept = [j for j in scope if j != person]
+            lookups = [
+                [index(genes, scopes[i]) for genes in assignments(scope)]
+                for i in used
+            ]
+            self.clusters.append((
+                person,
+                used,
+                lookups,
+                [index(genes, kept) for genes in assignments(scope)],
+                [genes[person] for genes in assignments(scope)],
+                3 ** len(kept),
+            ))
+            self.parents.append(None)
+
+            i = self.size + len(self.clusters)
+            scopes[i] = tuple(kept)
+            sent_by[i] = len(self.clusters) - 1
+            for j in kept:
+                involving[j].add(i)
+
+        # Where each message was looked up in the cluster it was sent to
+        self.received = [None] * len(self.clusters)
+        for c, (_, used, lookups, _, _, _) in enumerate(self.clusters):
+            for i, lookup in zip(used, lookups):
+                if i in sent_by:
+                    self.received[sent_by[i]] = lookup
+
+
+def index(genes, scope):
+    """
+    Return the position of an assignment of `genes` to `scope` in a table
+    listing every assignment in the order of `assignments`.
+    """
+    position = 0
+    for person in scope:
+        position = position * 3 + genes[person]
+    return position
+
+
+def infer(people, tree=None):
+    """
+    Return gene and trait probabilities for each person, conditioned on
+    the known traits, in the same form as `enumerate_probabilities`.
+
+    Variable elimination passes messages up a junction tree whose
+    clusters are the factors built while eliminating each person; a
+    second pass back down gives every cluster its exact belief. The work
+    grows with the number of people times the size of the largest
+    cluster, which stays small for family trees. A `tree` planned for a
+    family of the same structure may be given to skip planning.
+    """
+    if tree is None:
+        tree = JunctionTree(people)
+    names = list(people)
+    tables = {i: person_table(people, name) for i, name in enumerate(names)}
+
+    # Eliminate each person, passing a normalized message up the tree
+    potentials = []
+    messages = []
+    for person, used, lookups, sends, _, size in tree.clusters:
+        potential = [1] * len(sends)
+        for i, lookup in zip(used, lookups):
+            table = tables.pop(i)
+            potential = [p * table[j] for p, j in zip(potential, lookup)]
+        message = [0] * size
+        for p, j in zip(potential, sends):
+            message[j] += p
+        total = sum(message)
+        message = [p / total for p in message]
+        tables[tree.size + len(potentials) + 1] = message
+        potentials.append(potential)
+        messages.append(message)
+
+    # Pass messages back down, from the last cluster to the first
+    beliefs = [None] * len(tree.clusters)
+    for c in reversed(range(len(tree.clusters))):
+        potential = potentials[c]
+        parent = tree.parents[c]
+        if parent is not None:
+            separator = [0] * len(messages[c])
+            for p, j in zip(beliefs[parent], tree.received[c]):
+                separator[j] += p
+            ratio = [
+                new / old if old else 0
+                for new, old in zip(separator, messages[c])
+            ]
+            potential = [
+                p * ratio[j] for p, j in zip(potential, tree.clusters[c][3])
+            ]
+        total = sum(potential)
+        beliefs[c] = [p / total for p in potential]
+
+    # Read off each person's gene distribution, and their trait's
+    probabilities = dict()
+    for (person, _, _, _, genes_of, _), belief in zip(tree.clusters,
+                                                      beliefs):
+        genes = [0, 0, 0]
+        for p, x in zip(belief, genes_of):
+            genes[x] += p
+        trait = people[names[person]]["trait"]
+        if trait is None:
+            has_trait = sum(
+                genes[x] * PROBS["trait"][x][True] for x in range(3)
+            )
+        else:
+            has_trait = 1 if trait else 0
+        probabilities[names[person]] = {
+            "gene": {
+                2: genes[2],
+                1: genes[1],
+                0: genes[0]
+            },
+            "trait": {
+                True: has_trait,
+                False: 1 - has_trait
+            }
+        }
+    return {person: probabilities[person] for person in people}
+
+
+def sample_probabilities(people, method="gibbs", samples=SAMPLES,
+                         seconds=None, chains=CHAINS, seed=None):
+    """
+    Return approximate gene and trait probabilities for each person, in
+    the same form as `infer`, and a dictionary of diagnostics.
+
+    `method` is "weighting" for likelihood weighting or "gibbs" for Gibbs
+    sampling of gene counts. `samples` are split across `chains` run in
+    separate processes, each stopping early once `seconds` have passed
+    since it started; with no `samples`, chains run for `seconds` alone.
+    Every chain keeps at least one batch or sweep, however short the time.
+    Trait probabilities are averaged over each sample's genes rather than
+    sampled.
+    """
+    family = compile_family(people)
+    quota = None if samples is None else -(-samples // chains)
+    tasks = [
+        (family, quota, seconds, sequence)
+        for sequence in np.random.SeedSequence(seed).spawn(chains)
+    ]
+    run = likelihood_weighting if method == "weighting" else gibbs_chain
+    if chains == 1:
+        results = [run(*tasks[0])]
+    else:
+        context = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods()
+            else None
+        )
+        with context.Pool(chains) as pool:
+            results = pool.starmap(run, tasks)
+
+    if method == "weighting":
+        genes, traits, diagnostics = combine_weighted(results)
+    else:
+        genes, traits, diagnostics = combine_chains(results)
+
+    probabilities = dict()
+    for i, name in enumerate(family.names):
+        has_trait = traits[i]
+        if family.traits[i] is not None:
+            has_trait = family.traits[i]
+        probabilities[name] = {
+            "gene": {
+                2: genes[i][2],
+                1: genes[i][1],
+                0: genes[i][0]
+            },
+            "trait": {
+                True: has_trait,
+                False: 1 - has_trait
+            }
+        }
+    return probabilities, diagnostics
+
+
+def draw(probabilities, rng):
+    """
+    Return a gene count drawn from each row of `probabilities`.
+    """
+    cumulative = np.cumsum(probabilities, axis=-1)
+    u = rng.random(cumulative.shape[:-1]) * cumulative[..., -1]
+    return (u >= cumulative[..., 0]).astype(np.int64) + (
+        u >= cumulative[..., 1]
+    )
+
+
+def likelihood_weighting(family, samples, seconds, sequence):
+    """
+    Draw particles of everyone's gene counts from the family model, each
+    weighted by the probability of the known traits, until `samples` are
+    drawn or, after the first batch, `seconds` have passed.
+
+    Return the weighted gene counts, the weighted trait probabilities of
+    the people whose traits are unknown and the list of their indexes,
+    the total weight and the total squared weight, with the sums all
+    scaled by exp(-shift), and then the shift and the number of particles.
+    """
+    deadline = None if seconds is None else time.time() + seconds
+    rng = np.random.default_rng(sequence)
+    n = len(family.names)
+    founder_table = np.array(family.founder_table)
+    child_table = np.array(family.child_table).reshape(9, 3)
+    trait_table = np.array(family.trait_table)
+    known = [i for i in range(n) if family.traits[i] is not None]
+    unknown = [i for i in range(n) if family.traits[i] is None]
+
+    genes_total = np.zeros(n * 3)
+    traits_total = np.zeros(len(unknown))
+    weight = weight_squared = 0
+    shift = -math.inf
+    drawn = 0
+    while samples is None or drawn < samples:
+        if drawn and deadline is not None and time.time() > deadline:
+            break
+        size = PARTICLES if samples is None else min(PARTICLES,
+                                                     samples - drawn)
+
+        # Draw everyone's gene counts, parents before children
+        genes = np.empty((size, n), np.int64)
+        for i in family.order:
+            mother = family.mothers[i]
+            if mother < 0:
+                probabilities = np.broadcast_to(founder_table, (size, 3))
+            else:
+                probabilities = child_table[
+                    3 * genes[:, mother] + genes[:, family.fathers[i]]
+                ]
+            genes[:, i] = draw(probabilities, rng)
+
+        # Weight each particle by the likelihood of the known traits
+        log_weights = np.zeros(size)
+        for i in known:
+            log_weights += np.log(trait_table[genes[:, i], family.traits[i]])
+        if log_weights.max() > shift:
+            rescale = math.exp(shift - log_weights.max())
+            genes_total *= rescale
+            traits_total *= rescale
+            weight *= rescale
+            weight_squared *= rescale ** 2
+            shift = log_weights.max()
+        weights = np.exp(log_weights - shift)
+
+        genes_total += np.bincount(
+            (genes + 3 * np.arange(n)).ravel(),
+            weights=np.repeat(weights, n), minlength=3 * n
+        )
+        traits_total += weights @ trait_table[genes[:, unknown], 1]
+        weight += weights.sum()
+        weight_squared += (weights ** 2).sum()
+        drawn += size
+    return (genes_total.reshape(n, 3), traits_total, unknown, weight,
+            weight_squared, shift, drawn)
+
+
+def combine_weighted(results):
+    """
+    Return gene and trait probabilities, and diagnostics, from the results
+    of several runs of `likelihood_weighting`.
+    """
+    shift = max(result[5] for result in results)
+    genes = 0
+    traits = 0
+    weight = weight_squared = 0
+    for (genes_total, traits_total, unknown, total, squared, own_shift,
+         _) in results:
+        scale = math.exp(own_shift - shift) if own_shift > -math.inf else 0
+        genes = genes + genes_total * scale
+        traits = traits + traits_total * scale
+        weight += total * scale
+        weight_squared += squared * scale ** 2
+
+    trait_probabilities = np.zeros(len(genes))
+    trait_probabilities[unknown] = traits / weight
+    particles = sum(result[6] for result in results)
+    return genes / weight, trait_probabilities, {
+        "particles": particles,
+        "effective sample size": round(float(weight ** 2 / weight_squared), 1),
+    }
+
+
+def gibbs_blocks(family):
+    """
+    Return the family split into blocks of people with no relatives in
+    common in the moral graph, so each block can be resampled at once.
+
+    Each block is (people, their mothers, their fathers, the children
+    links of its people as (person's position in the block, child, other
+    parent, whether the person is the mother)).
+    """
+    relatives = moral_graph({
+        i: {
+            "mother": family.mothers[i] if family.mothers[i] >= 0 else None,
+            "father": family.fathers[i] if family.fathers[i] >= 0 else None,
+        }
+        for i in range(len(family.names))
+    })
+
+    # Color people greedily, most connected first
+    colors = {}
+    for i in sorted(relatives, key=lambda i: -len(relatives[i])):
+        taken = {colors[j] for j in relatives[i] if j in colors}
+        colors[i] = next(c for c in itertools.count() if c not in taken)
+
+    blocks = []
+    for color in range(max(colors.values(), default=-1) + 1):
+        members = [i for i in range(len(colors)) if colors[i] == color]
+        position = {i: k for k, i in enumerate(members)}
+        links = [
+            (position[parent], child, other, parent == mother)
+            for child, (mother, father) in enumerate(zip(family.mothers,
+                                                         family.fathers))
+            if mother >= 0
+            for parent, other in ((mother, father), (father, mother))
+            if parent in position
+        ]
+        blocks.append((
+            np.array(members),
+            np.array([family.mothers[i] for i in members]),
+            np.array([family.fathers[i] for i in members]),
+            np.array(links, np.int64).reshape(-1, 4),
+        ))
+    return blocks
+
+
+def gibbs_chain(family, samples, seconds, sequence):
+    """
+    Run a Gibbs sampler over everyone's gene counts, resampling one block
+    of unrelated people at a time from their distribution given the
+    rest, until `samples` sweeps are kept or, once one is kept, `seconds`
+    have passed. The first BURN_IN of the sweeps (or of the time) is
+    discarded.
+
+    Return the kept gene counts, summed trait probabilities, the sums of
+    each person's gene count and its square, and the number of sweeps
+    kept.
+    """
+    deadline = None if seconds is None else time.time() + seconds
+    rng = np.random.default_rng(sequence)
+    n = len(family.names)
+    log_founder = np.log(family.founder_table)
+    log_child = np.log(family.child_table).reshape(3, 3, 3)
+    trait_table = np.array(family.trait_table)
+    log_traits = np.array([
+        np.log(trait_table[:, trait]) if trait is not None else np.zeros(3)
+        for trait in family.traits
+    ])
+    blocks = gibbs_blocks(family)
+
+    # Start from a draw of everyone's gene counts from the family model
+    genes = np.zeros(n, np.int64)
+    for i in family.order:
+        mother = family.mothers[i]
+        if mother < 0:
+            genes[i] = draw(np.array(family.founder_table), rng)
+        else:
+            genes[i] = draw(np.exp(
+                log_child[genes[mother], genes[family.fathers[i]]]
+            ), rng)
+
+    burn_in = None if samples is None else math.ceil(
+        samples * BURN_IN / (1 - BURN_IN)
+    )
+    warm = None if deadline is None else (
+        deadline - seconds * (1 - BURN_IN)
+    )
+    genes_total = np.zeros(n * 3)
+    traits_total = np.zeros(n)
+    moments = np.zeros((2, n))
+    sweeps = kept = 0
+    while samples is None or kept < samples:
+        if kept and deadline is not None and time.time() > deadline:
+            break
+        for members, mothers, fathers, links in blocks:
+            log_p = log_traits[members].copy()
+            founders = mothers < 0
+            log_p[founders] += log_founder
+            log_p[~founders] += log_child[
+                genes[mothers[~founders]], genes[fathers[~founders]]
+            ]
+            if len(links):
+                position, child, other, is_mother = links.T
+                for x in range(3):
+                    mother = np.where(is_mother, x, genes[other])
+                    father = np.where(is_mother, genes[other], x)
+                    np.add.at(log_p[:, x], position,
+                              log_child[mother, father, genes[child]])
+            log_p -= log_p.max(axis=1, keepdims=True)
+            genes[members] = draw(np.exp(log_p), rng)
+        sweeps += 1
+
+        if burn_in is not None and sweeps <= burn_in:
+            continue
+        if warm is not None and time.time() < warm:
+            continue
+        genes_total[genes + 3 * np.arange(n)] += 1
+        traits_total += trait_table[genes, 1]
+        moments[0] += genes
+        moments[1] += genes ** 2
+        kept += 1
+    return genes_total.reshape(n, 3), traits_total, moments, kept
+
+
+def combine_chains(results):
+    """
+    Return gene and trait probabilities, and diagnostics, from the results
+    of several runs of `gibbs_chain`.
+
+    The diagnostics include the largest potential scale reduction factor
+    (R-hat) of anyone's gene count across chains; values near 1 suggest
+    the chains have converged.
+    """
+    kept = sum(result[3] for result in results)
+    genes = sum(result[0] for result in results) / kept
+    traits = sum(result[1] for result in results) / kept
+    diagnostics = {"chains": len(results), "sweeps kept": kept}
+
+    # Compare variation between chains to variation within them
+    lengths = np.array([result[3] for result in results])
+    if len(results) > 1 and lengths.min() > 1:
+        length = lengths.min()
+        means = np.array([m[0] / k for _, _, m, k in results])
+        variances = np.array([
+            (m[1] - k * (m[0] / k) ** 2) / (k - 1) for _, _, m, k in results
+        ])
+        within = variances.mean(axis=0)
+        between = length * means.var(axis=0, ddof=1)
+        pooled = (length - 1) / length * within + between / length
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r_hat = np.sqrt(np.where(within > 0, pooled / within, 1))
+        diagnostics["max r-hat"] = round(float(r_hat.max()), 4)
+    return genes, traits, diagnostics
+
+
 if __name__ == "__main__":
     main()
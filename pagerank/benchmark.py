@@ -0,0 +1,115 @@
+import random
+import sys
+import tempfile
+import time
+
+from outofcore import (MEMORY, build_edge_files, rank_edge_files,
+                       resident_memory)
+from pagerank import (DAMPING, LinkGraph, apply_delta, power_iteration,
+                      update_pagerank)
+
+# Average number of links on each page of the synthetic corpus
+LINKS = 8
+
+# Convergence tolerances compared
+TOLERANCES = [1e-3, 1e-4, 1e-5, 1e-6]
+
+# Out-of-core update methods compared, with and without extrapolation
+MODES = [
+    ("jacobi", False),
+    ("gauss-seidel", False),
+    ("jacobi", True),
+    ("gauss-seidel", True),
+]
+
+
+def main():
+    if len(sys.argv) not in [1, 2, 3]:
+        sys.exit("Usage: python benchmark.py [pages] [changes]")
+    size = int(sys.argv[1]) if len(sys.argv) >= 2 else 100000
+    changes = int(sys.argv[2]) if len(sys.argv) == 3 else 100
+
+    # Rank a random corpus, then change it
+    random.seed(0)
+    corpus = generate_corpus(size)
+    graph = LinkGraph(corpus)
+    ranks, _ = power_iteration(graph, DAMPING, min(TOLERANCES))
+    delta = generate_delta(corpus, changes)
+
+    # Rank the changed corpus from scratch and by updating the old graph
+    # and ranks, each timed from the delta to the new ranks
+    print(f"{size} pages, {changes} pages and links added and removed")
+    print(f"{'tolerance':>10}{'full sweeps':>13}{'full s':>9}"
+          f"{'warm sweeps':>13}{'warm s':>9}{'L1 apart':>10}")
+    for tolerance in TOLERANCES:
+        start = time.perf_counter()
+        changed = LinkGraph(apply_delta(corpus, delta))
+        full, full_sweeps = power_iteration(changed, DAMPING, tolerance)
+        full_time = time.perf_counter() - start
+        start = time.perf_counter()
+        updated, warm, warm_sweeps = update_pagerank(
+            graph, ranks, delta, DAMPING, tolerance
+        )
+        warm_time = time.perf_counter() - start
+        print(f"{tolerance:>10.0e}{full_sweeps:>13}{full_time:>9.3f}"
+              f"{warm_sweeps:>13}{warm_time:>9.3f}"
+              f"{abs(full - warm).sum():>10.1e}")
+
+    # Rank the changed corpus out of core with each update method, given
+    # MEMORY MiB beyond what the benchmark already holds
+    print()
+    print("Out of core: sweeps and seconds, +x with extrapolation")
+    print(f"{'tolerance':>10}" + "".join(
+        f"{method + (' +x' if extrapolate else ''):>20}"
+        for method, extrapolate in MODES
+    ))
+    with tempfile.TemporaryDirectory() as directory:
+        build_edge_files(directory, changed.pages,
+                         lambda: [(changed.sources, changed.targets)])
+        for tolerance in TOLERANCES:
+            row = f"{tolerance:>10.0e}"
+            for method, extrapolate in MODES:
+                start = time.perf_counter()
+                memory = resident_memory() + (MEMORY << 20)
+                _, sweeps = rank_edge_files(directory, DAMPING, tolerance,
+                                            memory, method, extrapolate)
+                elapsed = time.perf_counter() - start
+                row += f"{sweeps:>12}{elapsed:>8.3f}"
+            print(row)
+
+
+def generate_corpus(size):
+    """
+    Return a random corpus of `size` pages, some of which link nowhere.
+    """
+    pages = [f"{i}.html" for i in range(size)]
+    return {
+        page: set(random.choices(pages, k=random.randrange(2 * LINKS))) - {page}
+        for page in pages
+    }
+
+
+def generate_delta(corpus, changes):
+    """
+    Return a delta adding and removing `changes` pages, and `changes`
+    links per change.
+    """
+    pages = list(corpus)
+    added = [f"new{i}.html" for i in range(changes)]
+    targets = pages + added
+    return {
+        "remove_pages": set(random.sample(pages, changes)),
+        "add_pages": set(added),
+        "remove_links": {
+            (page, link) for page in random.sample(pages, changes)
+            for link in corpus[page]
+        },
+        "add_links": {
+            (random.choice(targets), random.choice(targets))
+            for _ in range(changes * LINKS)
+        },
+    }
+
+
+if __name__ == "__main__":
+    main()
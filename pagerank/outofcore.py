@@ -0,0 +1,473 @@
+import mmap
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+from pagerank import DAMPING, PARALLEL, TOLERANCE, TOP, extract_links
+
+# Update methods for each sweep
+METHODS = ["jacobi", "gauss-seidel"]
+
+# Default memory target for ranking, in MiB
+MEMORY = 256
+
+# Working memory needed for each page and each link in a block: the link
+# itself, its row, and the ranks and weights gathered for it
+BLOCK_BYTES = 96
+
+# Bytes before each released block that may have been mapped again
+READ_AROUND = 2 << 20
+
+# Values handled at a time in elementwise work on whole rank vectors
+PIECE = 1 << 16
+
+# Most links pulled at a time by a Gauss-Seidel sweep; smaller blocks
+# see more of the ranks already updated in the same sweep
+GAUSS_SEIDEL_BLOCK = 1 << 16
+
+# Extrapolation is only tried once the ratio between successive changes
+# holds within STABLE of itself and is above SLOW, where it pays; after
+# a rejected extrapolation it waits EXTRAPOLATE sweeps, then twice that
+STABLE = 0.05
+SLOW = 0.5
+EXTRAPOLATE = 5
+
+# Edges read back at a time when building from a corpus
+BUILD_CHUNK = 1 << 20
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        pages, chunks = scan_links(sys.argv[2], sys.argv[3])
+        build_edge_files(sys.argv[3], pages, chunks)
+        os.remove(os.path.join(sys.argv[3], "scanned"))
+        return
+    if len(sys.argv) not in [3, 4, 5, 6] or sys.argv[1] != "rank":
+        sys.exit("Usage: python outofcore.py build corpus graph\n"
+                 "       python outofcore.py rank graph [memory_mib] "
+                 "[jacobi|gauss-seidel] [extrapolate]")
+    directory = sys.argv[2]
+    memory = int(sys.argv[3]) if len(sys.argv) >= 4 else MEMORY
+    method = sys.argv[4] if len(sys.argv) >= 5 else METHODS[0]
+    extrapolate = len(sys.argv) == 6 and sys.argv[5] == "extrapolate"
+    if method not in METHODS:
+        sys.exit(f"Method must be one of {', '.join(METHODS)}.")
+
+    start = time.perf_counter()
+    try:
+        ranks, sweeps = rank_edge_files(directory, DAMPING, TOLERANCE,
+                                        memory << 20, method, extrapolate)
+    except ValueError as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - start
+    print(f"PageRank Results ({method}, {sweeps} sweeps, {elapsed:.2f}s)")
+
+    # Only the best pages' names are needed
+    best = top_ranks(ranks, TOP)
+    names = read_pages(directory, {page for page, _ in best})
+    for page, rank in best:
+        print(f"  {names[page]}: {rank:.4f}")
+
+
+def scan_links(corpus, directory):
+    """
+    Scan the HTML pages in `corpus` once, writing their links to a
+    "scanned" file in `directory` as they are found rather than holding
+    them in memory.
+
+    Return the sorted page names, and a function yielding the links as
+    chunks of (sources, targets) arrays of indexes into them.
+    """
+    pages = sorted(
+        entry.name for entry in os.scandir(corpus)
+        if entry.name.endswith(".html") and entry.is_file()
+    )
+    index = {page: i for i, page in enumerate(pages)}
+    paths = [os.path.join(corpus, page) for page in pages]
+    os.makedirs(directory, exist_ok=True)
+    scanned = os.path.join(directory, "scanned")
+
+    # Only links to other pages in the corpus are kept, as in `crawl`
+    with open(scanned, "wb") as f:
+        if len(paths) >= PARALLEL:
+            pool = multiprocessing.Pool()
+            found = pool.imap(extract_links, paths, chunksize=16)
+        else:
+            pool = None
+            found = map(extract_links, paths)
+        try:
+            for source, links in enumerate(found):
+                targets = sorted(
+                    index[link] for link in links
+                    if link in index and index[link] != source
+                )
+                np.array([(source, target) for target in targets],
+                         np.int64).tofile(f)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def chunks():
+        with open(scanned, "rb") as f:
+            while len(pairs := np.fromfile(f, np.int64, 2 * BUILD_CHUNK)):
+                yield pairs[0::2].copy(), pairs[1::2].copy()
+
+    return pages, chunks
+
+
+def build_edge_files(directory, pages, chunks):
+    """
+    Write a graph to `directory` as edge lists on disk.
+
+    `pages` lists the page names, and `chunks()` yields the links as
+    (sources, targets) arrays of page indexes; it is called once per pass,
+    so the links never all need to be in memory. The links are written
+    sorted by source ("out" files) and by target ("in" files), each as an
+    int64 offsets file and an int64 edges file in compressed sparse row
+    form.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "pages.txt"), "w") as f:
+        for page in pages:
+            f.write(page + "\n")
+
+    # Count links from and to each page
+    n = len(pages)
+    out_degree = np.zeros(n, np.int64)
+    in_degree = np.zeros(n, np.int64)
+    for sources, targets in chunks():
+        out_degree += np.bincount(sources, minlength=n)
+        in_degree += np.bincount(targets, minlength=n)
+
+    write_rows(os.path.join(directory, "out"), out_degree, chunks, True)
+    write_rows(os.path.join(directory, "in"), in_degree, chunks, False)
+
+
+def write_rows(prefix, degree, chunks, by_source):
+    """
+    Scatter every link into its row of an edges file, rows being sources
+    if `by_source` or else targets, and write the row offsets.
+    """
+    offsets = np.concatenate(([0], np.cumsum(degree)))
+    offsets.tofile(prefix + "_offsets")
+    with open(prefix + "_edges", "wb") as f:
+        f.truncate(8 * int(offsets[-1]))
+    if offsets[-1] == 0:
+        return
+
+    edges = np.memmap(prefix + "_edges", np.int64, "r+")
+    fill = offsets[:-1].copy()
+    for sources, targets in chunks():
+        rows, values = (sources, targets) if by_source else (targets, sources)
+        order = np.argsort(rows, kind="stable")
+        rows = rows[order]
+        values = values[order]
+
+        # Place each link after the ones already in its row
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        edges[fill[rows] + rank] = values
+        fill += np.bincount(rows, minlength=len(degree))
+    edges.flush()
+    del edges
+
+
+def read_pages(directory, wanted):
+    """
+    Return a dictionary naming the `wanted` page indexes of a graph.
+    """
+    names = {}
+    with open(os.path.join(directory, "pages.txt")) as f:
+        for i, line in enumerate(f):
+            if i in wanted:
+                names[i] = line.rstrip("\n")
+    return names
+
+
+class EdgeFile():
+
+    def __init__(self, prefix):
+        """
+        Map the offsets and edges files starting with `prefix`.
+        """
+        self.maps = []
+        self.offsets = self.open(prefix + "_offsets")
+        self.edges = self.open(prefix + "_edges")
+        self.size = len(self.offsets) - 1
+
+    def open(self, path):
+        """
+        Map a file of int64 values read-only, returning them as an array.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return np.zeros(0, np.int64)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        return np.frombuffer(mapped, np.int64)
+
+    def blocks(self, block):
+        """
+        Yield (first row, row offsets, edges) for consecutive blocks of at
+        most `block` rows holding about `block` edges, releasing each
+        block's pages from memory once the caller is done with it.
+        """
+        row = 0
+        while row < self.size:
+            # Search only this block's rows, whose pages are released after
+            offsets = np.array(self.offsets[row:row + block + 1])
+            end = row + max(1, int(np.searchsorted(
+                offsets, offsets[0] + block, side="right"
+            )) - 1)
+            offsets = offsets[:end - row + 1]
+            yield row, offsets - offsets[0], self.edges[offsets[0]:offsets[-1]]
+            self.release(row, end)
+            row = end
+
+    def release(self, row, end):
+        """
+        Drop the mapped pages holding rows `row` to `end` from memory.
+        """
+        spans = [
+            (self.maps[0], 8 * row, 8 * (end + 1)),
+            (self.maps[-1], 8 * int(self.offsets[row]),
+             8 * int(self.offsets[end])),
+        ]
+        for mapped, start, stop in spans:
+            # The kernel maps pages around each one read, so pages just
+            # before the block may have been mapped again
+            start = max(0, start - start % mmap.PAGESIZE - READ_AROUND)
+            if stop > start and hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_DONTNEED, start,
+                               min(stop, len(mapped)) - start)
+
+    def close(self):
+        """
+        Unmap the files.
+        """
+        self.offsets = self.edges = None
+        for mapped in self.maps:
+            mapped.close()
+
+
+def rank_edge_files(directory, damping_factor, tolerance, memory,
+                    method="jacobi", extrapolate=False):
+    """
+    Return PageRank values for the graph in `directory`, as an array
+    indexed like its pages, and the number of sweeps taken.
+
+    Only a few rank vectors are held in memory; links are streamed from
+    the mapped edge files in blocks sized so the whole process peaks
+    within `memory` bytes. "jacobi" sweeps push rank along the
+    source-sorted links; "gauss-seidel" sweeps pull rank along the
+    target-sorted links in blocks of at most GAUSS_SEIDEL_BLOCK links,
+    using each block's new ranks in the blocks after it. With
+    `extrapolate`, Aitken extrapolation is tried once convergence is slow
+    and steady, and kept only if it lowers the change of the next sweep
+    below what a plain sweep would reach.
+    """
+    baseline = resident_memory()
+    links = EdgeFile(os.path.join(directory, "out"))
+    n = links.size
+    weights = np.empty(n)
+    for piece in pieces(n):
+        weights[piece] = np.diff(links.offsets[piece.start:piece.stop + 1])
+    links.close()
+    if method == "gauss-seidel":
+        links = EdgeFile(os.path.join(directory, "in"))
+    else:
+        links = EdgeFile(os.path.join(directory, "out"))
+
+    # Ranks, their previous values and link weights are always held, with
+    # the dangling flags; Gauss-Seidel keeps each page's weighted rank,
+    # extrapolation keeps two more sweeps of history, and pages may be
+    # mapped around each file's block
+    vectors = (3 + (1 if method == "gauss-seidel" else 0)
+               + (2 if extrapolate else 0))
+    spare = memory - baseline - n * (8 * vectors + 1) - 4 * READ_AROUND
+    if spare < 2 * BLOCK_BYTES:
+        links.close()
+        raise ValueError(f"{memory} bytes is too little to rank {n} pages.")
+    block = spare // (2 * BLOCK_BYTES)
+
+    dangling = weights == 0
+    np.divide(1, weights, out=weights, where=~dangling)
+    ranks = np.full(n, 1 / n)
+    previous = np.empty(n)
+    shares = np.empty(n) if method == "gauss-seidel" else None
+    history = [np.empty(n), np.empty(n)] if extrapolate else []
+    held = 0
+    changes = []
+    pending = None
+    wait, gap = 0, EXTRAPOLATE
+    sweeps = 0
+    try:
+        while True:
+            sweeps += 1
+            if method == "gauss-seidel":
+                np.copyto(previous, ranks)
+                gauss_seidel_sweep(links, ranks, shares, weights, dangling,
+                                   damping_factor,
+                                   min(block, GAUSS_SEIDEL_BLOCK))
+            else:
+                jacobi_sweep(links, ranks, previous, weights, dangling,
+                             damping_factor, block)
+                ranks, previous = previous, ranks
+
+            change = distance(ranks, previous)
+            if change < tolerance:
+                return ranks, sweeps
+            if not extrapolate:
+                continue
+
+            # Go back to the vector before an extrapolation that did
+            # worse than a plain sweep would have, and wait longer
+            # before trying again
+            if pending is not None:
+                bound, pending = pending, None
+                if change >= bound:
+                    np.copyto(ranks, history[0])
+                    held, changes = 0, []
+                    wait, gap = sweeps + gap, 2 * gap
+                    continue
+
+            changes = (changes + [change])[-3:]
+            if len(changes) == 3 and held == 2 and sweeps >= wait:
+                ratio = changes[2] / changes[1]
+                if (ratio > SLOW and abs(ratio - changes[1] / changes[0])
+                        < STABLE * ratio):
+                    aitken(history[0], history[1], ranks)
+                    pending = ratio * change
+                    held, changes = 0, []
+                    continue
+
+            # Keep the last two rank vectors
+            history.reverse()
+            np.copyto(history[1], ranks)
+            held = min(2, held + 1)
+    finally:
+        links.close()
+
+
+def resident_memory():
+    """
+    Return the most memory this process has held so far, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def pieces(n):
+    """
+    Yield slices covering `n` values a few at a time, so elementwise work
+    on whole vectors needs little scratch memory.
+    """
+    for start in range(0, n, PIECE):
+        yield slice(start, min(n, start + PIECE))
+
+
+def distance(first, second):
+    """
+    Return the L1 distance between two vectors.
+    """
+    return sum(
+        np.abs(first[piece] - second[piece]).sum()
+        for piece in pieces(len(first))
+    )
+
+
+def dangling_rank(ranks, dangling):
+    """
+    Return the total rank of pages without links.
+    """
+    return sum(
+        ranks[piece][dangling[piece]].sum() for piece in pieces(len(ranks))
+    )
+
+
+def jacobi_sweep(links, ranks, flow, weights, dangling, damping_factor,
+                 block):
+    """
+    Fill `flow` with the next rank vector, pushing each page's rank along
+    its links in source-sorted blocks.
+    """
+    n = len(ranks)
+    flow.fill(0)
+    for row, offsets, targets in links.blocks(block):
+        end = row + len(offsets) - 1
+        shares = np.repeat(ranks[row:end] * weights[row:end],
+                           np.diff(offsets))
+        np.add.at(flow, targets, shares)
+    spread = dangling_rank(ranks, dangling) / n
+    flow += spread
+    flow *= damping_factor
+    flow += (1 - damping_factor) / n
+
+
+def gauss_seidel_sweep(links, ranks, shares, weights, dangling,
+                       damping_factor, block):
+    """
+    Update `ranks` in place, pulling rank into each page along its inbound
+    links in target-sorted blocks, so later blocks see the ranks already
+    updated this sweep. `shares` is scratch space for each page's rank
+    divided among its links.
+    """
+    n = len(ranks)
+    spread = dangling_rank(ranks, dangling)
+    for piece in pieces(n):
+        np.multiply(ranks[piece], weights[piece], out=shares[piece])
+    for row, offsets, sources in links.blocks(block):
+        end = row + len(offsets) - 1
+
+        # Sum each page's inbound shares; pages without any get none
+        flow = np.zeros(end - row)
+        linked = offsets[1:] > offsets[:-1]
+        if len(sources):
+            flow[linked] = np.add.reduceat(shares[sources],
+                                           offsets[:-1][linked])
+        old = ranks[row:end][dangling[row:end]].sum()
+        ranks[row:end] = (1 - damping_factor) / n + damping_factor * (
+            flow + spread / n
+        )
+        shares[row:end] = ranks[row:end] * weights[row:end]
+
+        # Keep the dangling pages' total up to date with their new ranks
+        spread += ranks[row:end][dangling[row:end]].sum() - old
+    ranks /= ranks.sum()
+
+
+def aitken(first, second, third):
+    """
+    Replace `third` with an Aitken delta-squared extrapolation from it and
+    the two rank vectors before it, keeping its values wherever the
+    extrapolation is unstable, and move the vector it replaced to `first`.
+    """
+    for piece in pieces(len(third)):
+        step = third[piece] - second[piece]
+        curvature = step - (second[piece] - first[piece])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            extrapolated = third[piece] - step * step / curvature
+        stable = (np.abs(curvature) > 1e-15) & (extrapolated > 0)
+        first[piece] = third[piece]
+        third[piece][stable] = extrapolated[stable]
+    third /= third.sum()
+
+
+def top_ranks(ranks, k):
+    """
+    Return the `k` highest (page, rank) pairs in the array `ranks`, best
+    first, without building a structure holding every page.
+    """
+    k = min(k, len(ranks))
+    if k == 0:
+        return []
+    best = np.argpartition(ranks, -k)[-k:]
+    best = best[np.argsort(-ranks[best], kind="stable")]
+    return [(int(page), float(ranks[page])) for page in best]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,64 @@
+import heapq
+import multiprocessing
 import os
-import random
 import re
 import sys
-import copy
+from bisect import bisect_left
+from collections import deque
+
+import numpy as np
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Link graph cache written into the corpus directory by `crawl`
+LINK_CACHE = "pagerank.links.npz"
+
+# Bytes read from a page at a time, and the fewest changed pages worth
+# starting a process pool for
+CHUNK = 1 << 20
+PARALLEL = 64
+
+# Matches a link, capturing its target
+LINK = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# A complete tag, whose quoted attribute values may hold ">"
+CLOSED = re.compile(r"<[^>\"]*(?:\"[^\"]*\"[^>\"]*)*>")
+
+# Random surfers walked side by side when sampling, and the steps each
+# takes to forget its random starting page before its visits are counted
+WALKERS = 65536
+BURN_IN = 50
+
+# Iteration stops once the ranks change by less than this in total (L1)
+TOLERANCE = 1e-6
+
+# Personalized PageRank stops pushing once no page holds more residual than
+# this per link, which bounds how far short of the truth each estimate falls
+EPSILON = 1e-4
+
+# Number of pages shown for personalized PageRank
+TOP = 10
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python pagerank.py corpus [seed ...]")
     corpus = crawl(sys.argv[1])
+
+    # Rank pages from the point of view of the given seed pages
+    if len(sys.argv) > 2:
+        seeds = sys.argv[2:]
+        for seed in seeds:
+            if seed not in corpus:
+                sys.exit(f"No page {seed} in corpus.")
+        graph = LinkGraph(corpus)
+        ranks = personalized_pagerank(graph, seeds, DAMPING)
+        print(f"Personalized PageRank Results (top {TOP})")
+        for page, rank in top_pages(ranks, TOP):
+            print(f"  {page}: {rank:.4f}")
+        return
+
     ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
     for page in sorted(ranks):
@@ -27,28 +74,148 @@ def crawl(directory):
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
+
+    The links found on each page are cached in `directory` alongside the
+    page's size and modification time, so only new or changed pages are
+    parsed again.
     """
-    pages = dict()
+    # Find the pages, and which of them the cache is still good for
+    stamps = {
+        entry.name: (entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in os.scandir(directory)
+        if entry.name.endswith(".html") and entry.is_file()
+    }
+    cached = load_link_cache(directory)
+    links = {
+        filename: cached[filename][1] for filename in stamps
+        if filename in cached and cached[filename][0] == stamps[filename]
+    }
+
+    # Extract all links from new or changed HTML files
+    changed = [filename for filename in stamps if filename not in links]
+    paths = [os.path.join(directory, filename) for filename in changed]
+    if len(paths) >= PARALLEL:
+        with multiprocessing.Pool() as pool:
+            found = pool.map(extract_links, paths, chunksize=16)
+    else:
+        found = [extract_links(path) for path in paths]
+    links.update(zip(changed, found))
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
+    if changed or len(cached) != len(links):
+        try:
+            save_link_cache(directory, stamps, links)
+        except OSError:
+            pass
 
     # Only include links to other pages in the corpus
-    for filename in pages:
+    pages = dict()
+    for filename in stamps:
         pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
+            link for link in links[filename]
+            if link in stamps and link != filename
         )
 
     return pages
 
 
+def extract_links(path):
+    """
+    Return the set of links in the HTML file at `path`, reading and
+    scanning it a chunk at a time.
+    """
+    links = set()
+    with open(path) as f:
+        pending = ""
+        while chunk := f.read(CHUNK):
+            contents = pending + chunk
+            end = 0
+            for match in LINK.finditer(contents):
+                links.add(match.group(1))
+                end = match.end()
+
+            # A tag cut off by the end of the chunk is scanned again
+            # with the next one; text after a closed tag, or with no tag,
+            # is dropped
+            start = contents.rfind("<", end)
+            if start < 0 or CLOSED.match(contents, start):
+                pending = ""
+            else:
+                pending = contents[start:]
+        links.update(LINK.findall(pending))
+    return links
+
+
+def load_link_cache(directory):
+    """
+    Return the cached links in `directory` as a dictionary mapping each
+    page to its ((size, mtime), links) when parsed, or an empty dictionary
+    if there is no usable cache.
+    """
+    try:
+        with np.load(os.path.join(directory, LINK_CACHE)) as data:
+            pages = split_names(data["pages"])
+            vocabulary = split_names(data["vocabulary"])
+            sizes = data["sizes"].tolist()
+            mtimes = data["mtimes"].tolist()
+            offsets = data["offsets"].tolist()
+            targets = data["links"].tolist()
+    except (OSError, ValueError, KeyError):
+        return {}
+
+    cached = {}
+    for i, page in enumerate(pages):
+        cached[page] = (
+            (sizes[i], mtimes[i]),
+            {vocabulary[j] for j in targets[offsets[i]:offsets[i + 1]]}
+        )
+    return cached
+
+
+def save_link_cache(directory, stamps, links):
+    """
+    Write every page's links to the cache in `directory`.
+
+    Link names are stored once in a vocabulary, and each page's links as a
+    row of indexes into it.
+    """
+    pages = list(links)
+    vocabulary = {}
+    offsets = [0]
+    targets = []
+    for page in pages:
+        for link in links[page]:
+            targets.append(vocabulary.setdefault(link, len(vocabulary)))
+        offsets.append(len(targets))
+
+    path = os.path.join(directory, LINK_CACHE)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            pages=join_names(pages),
+            vocabulary=join_names(vocabulary),
+            sizes=np.array([stamps[page][0] for page in pages], np.int64),
+            mtimes=np.array([stamps[page][1] for page in pages], np.int64),
+            offsets=np.array(offsets, np.int64),
+            links=np.array(targets, np.int32),
+        )
+    os.replace(path + ".tmp", path)
+
+
+def join_names(names):
+    """
+    Return names as a byte array, NUL-separated.
+    """
+    return np.frombuffer("\0".join(names).encode("utf-8"), np.uint8)
+
+
+def split_names(data):
+    """
+    Return the names in a byte array written by `join_names`.
+    """
+    text = data.tobytes().decode("utf-8")
+    return text.split("\0") if text else []
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -75,7 +242,7 @@ def transition_model(corpus, page, damping_factor):
     return model
 
 
-def sample_pagerank(corpus, damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, seed=None):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
@@ -84,31 +251,67 @@ def sample_pagerank(corpus, damping_factor, n):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    a = {}
-    pr = {}
-    for i in corpus.keys():
-        a[i] = 0
+    graph = LinkGraph(corpus)
+    return graph.ranks(random_surfers(graph, damping_factor, n, seed))
 
-    sample = None
 
-    for j in range(n):
-        if sample == None:
-            sample = random.choice(list(corpus.keys()))
-            a[sample] += 1
-        else:
-            tran_model = transition_model(corpus, sample, damping_factor)
-            pages = list(tran_model.keys())
-            prob = [tran_model[z] for z in pages]
-            sample = random.choices(pages, prob)[0]
-            a[sample] += 1
+def random_surfers(graph, damping_factor, n, seed=None):
+    """
+    Estimate PageRank on a `LinkGraph` from `n` pages visited by random
+    surfers, walking many surfers at once with vectorized random draws.
+
+    Each step a surfer follows a uniformly chosen link with probability
+    `damping_factor` and otherwise, or when its page has no links, jumps
+    to a uniformly chosen page; both are O(1) per step.
+
+    Return the fraction of visits to each page as an array.
+    """
+    rng = np.random.default_rng(seed)
+    walkers = max(1, min(WALKERS, n))
+    positions = rng.integers(0, graph.size, walkers)
+    for _ in range(BURN_IN):
+        positions = surf(graph, damping_factor, positions, rng)
+
+    # Tally visits once at least a page's worth have been made, so counting
+    # costs O(pages) per batch of steps rather than per step
+    counts = np.zeros(graph.size, dtype=np.int64)
+    pending = []
+    pending_size = 0
+    remaining = n
+    while remaining > 0:
+        pending.append(positions[:remaining])
+        pending_size += len(pending[-1])
+        remaining -= walkers
+        if pending_size >= graph.size or remaining <= 0:
+            counts += np.bincount(np.concatenate(pending),
+                                  minlength=graph.size)
+            pending = []
+            pending_size = 0
+        positions = surf(graph, damping_factor, positions, rng)
+
+    return counts / n
 
-    for d in a.keys():
-        pr[d] = a[d]/n
 
-    return pr
+def surf(graph, damping_factor, positions, rng):
+    """
+    Move every random surfer at `positions` one step.
+    """
+    walkers = len(positions)
+    jumped = rng.integers(0, graph.size, walkers)
+    if len(graph.out_links) == 0:
+        return jumped
 
+    # Follow a uniformly chosen link where the surfer does not jump
+    degree = graph.out_degree[positions]
+    follow = (rng.random(walkers) < damping_factor) & (degree > 0)
+    chosen = graph.out_offsets[positions] + (
+        rng.random(walkers) * degree
+    ).astype(np.int64)
+    chosen = np.minimum(chosen, len(graph.out_links) - 1)
+    return np.where(follow, graph.out_links[chosen], jumped)
 
-def iterate_pagerank(corpus, damping_factor):
+
+def iterate_pagerank(corpus, damping_factor, tolerance=TOLERANCE):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -117,30 +320,319 @@ def iterate_pagerank(corpus, damping_factor):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    pr = {}
-    num_page = len(corpus.keys())
+    graph = LinkGraph(corpus)
+    ranks, _ = power_iteration(graph, damping_factor, tolerance)
+    return graph.ranks(ranks)
+
+
+def update_pagerank(graph, ranks, delta, damping_factor,
+                    tolerance=TOLERANCE):
+    """
+    Return the `LinkGraph` after a delta of changes, as `apply_delta`
+    describes, its PageRank vector and the number of sweeps taken, given
+    the `graph` and rank vector `ranks` from before the change.
+
+    The delta is applied to the graph's link arrays rather than rebuilding
+    it from a corpus, and the iteration is warm-started from the old
+    ranks, with new pages given an even share, so after a small change it
+    converges in fewer sweeps than a full recompute.
+    """
+    changed, moved = graph.changed(delta)
+    updated, sweeps = power_iteration(
+        changed, damping_factor, tolerance, warm_start(changed, ranks, moved)
+    )
+    return changed, updated, sweeps
+
+
+def warm_start(graph, ranks, moved):
+    """
+    Return a starting rank vector for `graph` from the rank vector `ranks`
+    of an earlier graph whose pages `moved` to the given indexes, or -1 if
+    they were removed, normalized to sum to 1.
+    """
+    start = np.full(graph.size, 1 / graph.size)
+    kept = moved >= 0
+    start[moved[kept]] = ranks[kept]
+    return start / start.sum()
+
+
+def apply_delta(corpus, delta):
+    """
+    Return a copy of `corpus` with a delta of changes applied.
+
+    `delta` is a dictionary whose optional keys are "remove_pages" and
+    "add_pages", sets of page names, and "remove_links" and "add_links",
+    sets of (page, linked page) pairs. Removals are applied first, and
+    links to removed pages are dropped with them.
+    """
+    removed = set(delta.get("remove_pages", ()))
+    changed = {
+        page: set(links) - removed
+        for page, links in corpus.items() if page not in removed
+    }
+    for page in delta.get("add_pages", ()):
+        changed.setdefault(page, set())
+    for page, link in delta.get("remove_links", ()):
+        if page in changed:
+            changed[page].discard(link)
+    for page, link in delta.get("add_links", ()):
+        if page in changed and link in changed and link != page:
+            changed[page].add(link)
+    return changed
+
+
+def edit_links(groups, members, removed, moved, dropped, added):
+    """
+    Return links from `groups` to `members`, arrays of page indexes sorted
+    by group, without the links touching `removed` pages or listed as
+    (group, member) pairs in `dropped`, renumbered by `moved`, and with
+    the new (group, member) pairs in `added`, already renumbered, inserted
+    into their groups in order, if the group's members are sorted.
+    """
+    keep = ~(removed[groups] | removed[members])
+    for group, member in dropped:
+        start, end = np.searchsorted(groups, [group, group + 1])
+        keep[start + np.flatnonzero(members[start:end] == member)] = False
+
+    # Renumbering keeps the links sorted by group
+    groups = moved[groups[keep]]
+    members = moved[members[keep]]
 
-    for i in corpus.keys():
-        pr[i] = 1 / num_page
+    places, new_groups, new_members = [], [], []
+    for group, member in sorted(added):
+        start, end = np.searchsorted(groups, [group, group + 1])
+        if not (members[start:end] == member).any():
+            places.append(start + np.searchsorted(members[start:end], member))
+            new_groups.append(group)
+            new_members.append(member)
+    return (np.insert(groups, places, new_groups),
+            np.insert(members, places, new_members))
 
-    change = 1
 
-    while change > 0.001:
-        pr_copy = copy.copy(pr)
-        for i in pr.keys():
-            a = (1 - damping_factor) / num_page
-            b = [k for k in corpus.keys() if i in corpus[k]]
-            d = []
-            if len(b) != 0:
-                for c in b:
-                    num_link = len(corpus[c])
-                    x = pr_copy[c] / num_link
-                    d.append(x)
-            pr[i] = a + (damping_factor * sum(d))
+class LinkGraph():
+
+    def __init__(self, corpus):
+        """
+        Build a sparse link matrix from a corpus returned by `crawl`.
+
+        Pages are numbered in sorted order. Each link is an edge from
+        `sources` to `targets`, and `weights` holds its entry in the
+        column-stochastic transition matrix: 1 over the number of links on
+        the source page. Pages without links are flagged in `dangling`;
+        their rank is spread over every page instead.
+
+        The links of page `i` are also listed in order of source, as
+        out_links[out_offsets[i]:out_offsets[i + 1]].
+        """
+        pages = sorted(corpus)
+        index = dict(zip(pages, range(len(pages))))
+        out_degree = np.fromiter(
+            (len(corpus[page]) for page in pages), np.int64, len(pages)
+        )
+        sources = np.repeat(np.arange(len(pages)), out_degree)
+        targets = np.fromiter(
+            (index[link] for page in pages for link in corpus[page]),
+            np.int64, len(sources)
+        )
+
+        # Lay the links out sorted by target, so each page's inbound links
+        # are contiguous, and keep them grouped by source too, for walking
+        order = np.argsort(targets, kind="stable")
+        self.build(pages, index, sources[order], targets[order], targets)
+
+    def build(self, pages, index, sources, targets, out_links):
+        """
+        Set up the graph of `pages`, numbered by `index`, from its links
+        from `sources` to `targets` sorted by target, and the same links'
+        targets sorted by source in `out_links`.
+        """
+        self.pages = pages
+        self.index = index
+        self.size = len(pages)
+        self.targets = targets
+        self.sources = sources
+
+        out_degree = np.bincount(sources, minlength=self.size)
+        self.out_degree = out_degree
+        self.out_offsets = np.concatenate(([0], np.cumsum(out_degree)))
+        self.out_links = out_links
+
+        self.dangling = out_degree == 0
+        self.weights = 1 / out_degree[self.sources]
+        self.adjacency = None
+
+    def changed(self, delta):
+        """
+        Return a new graph with a delta of changes applied, as
+        `apply_delta` applies it to a corpus, and an array giving the
+        index in the new graph of each page of this one, or -1 for pages
+        removed.
+
+        Only the pages and links named in the delta are looked up; the
+        rest of the links are filtered and renumbered as arrays, which
+        keeps them in order without sorting them again.
+        """
+        n = self.size
+        removed = np.zeros(n, bool)
+        for page in delta.get("remove_pages", ()):
+            if page in self.index:
+                removed[self.index[page]] = True
+
+        # Pages keep their sorted order, with added pages slotted between
+        kept = [
+            page for page, gone in zip(self.pages, removed.tolist())
+            if not gone
+        ]
+        added = sorted(
+            page for page in set(delta.get("add_pages", ()))
+            if page not in self.index or removed[self.index[page]]
+        )
+        places = np.array([bisect_left(kept, page) for page in added],
+                          np.int64)
+        moved = np.full(n, -1, np.int64)
+        moved[~removed] = np.arange(len(kept)) + np.searchsorted(
+            places, np.arange(len(kept)), side="right"
+        )
+        added_index = {
+            page: int(place) + k
+            for k, (page, place) in enumerate(zip(added, places))
+        }
+        pages = sorted(kept + added)
+        index = dict(zip(pages, range(len(pages))))
 
-            change = abs(pr_copy[i] - pr[i])
+        def position(page):
+            if page in added_index:
+                return added_index[page]
+            i = self.index.get(page)
+            return None if i is None or removed[i] else int(moved[i])
+
+        dropped = [
+            (self.index[page], self.index[link])
+            for page, link in delta.get("remove_links", ())
+            if page in self.index and link in self.index
+        ]
+        new = set()
+        for page, link in delta.get("add_links", ()):
+            source, target = position(page), position(link)
+            if source is not None and target is not None and source != target:
+                new.add((source, target))
+        new = sorted(new)
+
+        # Edit the links grouped by target, then by source
+        targets, sources = edit_links(
+            self.targets, self.sources, removed, moved,
+            [(target, source) for source, target in dropped],
+            [(target, source) for source, target in new]
+        )
+        _, out_links = edit_links(
+            np.repeat(np.arange(n), self.out_degree), self.out_links,
+            removed, moved, dropped, new
+        )
+        graph = LinkGraph.__new__(LinkGraph)
+        graph.build(pages, index, sources, targets, out_links)
+        return graph, moved
+
+    def ranks(self, values):
+        """
+        Return a dictionary mapping each page to its entry in `values`.
+        """
+        return {page: float(value) for page, value in zip(self.pages, values)}
+
+    def links(self):
+        """
+        Return the out-link offsets and links as Python lists, which are
+        faster than NumPy arrays to index one page at a time.
+        """
+        if self.adjacency is None:
+            self.adjacency = (self.out_offsets.tolist(),
+                              self.out_links.tolist())
+        return self.adjacency
+
+
+def personalized_pagerank(graph, seeds, damping_factor, epsilon=EPSILON):
+    """
+    Return approximate PageRank values on a `LinkGraph` for a surfer who
+    always jumps back to one of the `seeds` pages instead of a random page.
+
+    Uses forward push: rank is settled at a page and its remaining
+    residual pushed along its links until no page holds more than
+    `epsilon` per link, so only the neighborhood of the seeds is visited.
+    Pages without links pass their residual back to the seeds. Return a
+    dictionary of the pages reached and their values, which sum to just
+    under 1.
+    """
+    offsets, links = graph.links()
+    seeds = [graph.index[page] for page in seeds]
+    share = 1 / len(seeds)
+
+    estimates = {}
+    residuals = {}
+    for seed in seeds:
+        residuals[seed] = residuals.get(seed, 0) + share
+    queue = deque(residuals)
+    queued = set(queue)
+
+    while queue:
+        page = queue.popleft()
+        queued.discard(page)
+        residual = residuals.pop(page)
+
+        # Settle part of the residual here and push the rest on
+        settled = (1 - damping_factor) * residual
+        estimates[page] = estimates.get(page, 0) + settled
+        start, end = offsets[page], offsets[page + 1]
+        if end > start:
+            targets = links[start:end]
+        else:
+            targets = seeds
+        pushed = damping_factor * residual / len(targets)
+
+        for target in targets:
+            residual = residuals.get(target, 0) + pushed
+            residuals[target] = residual
+            degree = max(1, offsets[target + 1] - offsets[target])
+            if residual > epsilon * degree and target not in queued:
+                queue.append(target)
+                queued.add(target)
+
+    return {graph.pages[page]: value for page, value in estimates.items()}
+
+
+def top_pages(ranks, k):
+    """
+    Return the `k` highest (page, rank) pairs in `ranks`, best first,
+    using a heap rather than sorting every page.
+    """
+    return heapq.nlargest(k, ranks.items(), key=lambda item: item[1])
+
+
+def power_iteration(graph, damping_factor, tolerance, ranks=None):
+    """
+    Run the PageRank power iteration on a `LinkGraph`, starting from the
+    rank vector `ranks` (uniform if None), until the L1 change between
+    sweeps is below `tolerance`.
+
+    Return the rank vector and the number of sweeps taken.
+    """
+    n = graph.size
+    if ranks is None:
+        ranks = np.full(n, 1 / n)
+    sweeps = 0
+    while True:
+        sweeps += 1
+
+        # Rank flowing along links, plus dangling pages' rank spread evenly
+        flow = np.bincount(
+            graph.targets, weights=ranks[graph.sources] * graph.weights,
+            minlength=n
+        )
+        spread = ranks[graph.dangling].sum() / n
+        updated = (1 - damping_factor) / n + damping_factor * (flow + spread)
 
-    return pr
+        change = np.abs(updated - ranks).sum()
+        ranks = updated
+        if change < tolerance:
+            return ranks, sweeps
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import math
+import os
+import sys
+import time
+
+from mnk import Board, Engine, ParallelEngine
+
+# Fixed positions to search: name, rows, columns, win length, depth
+# searched when there is no time budget, and the moves leading to each
+# position as (i, j) cells
+SUITES = [
+    ("3x3 k=3", 3, 3, 3, 9, [
+        [],
+        [(1, 1)],
+        [(0, 0), (1, 1)],
+        [(0, 1), (1, 1), (2, 1)],
+        [(0, 0), (1, 1), (2, 2), (0, 2)],
+    ]),
+    ("4x4 k=3", 4, 4, 3, 7, [
+        [],
+        [(1, 1)],
+        [(1, 1), (2, 2)],
+        [(0, 0), (1, 1), (3, 3), (2, 1)],
+    ]),
+    ("7x7 k=4", 7, 7, 4, 4, [
+        [(3, 3)],
+        [(3, 3), (3, 4), (4, 4)],
+        [(3, 3), (2, 2), (3, 4), (3, 2), (4, 3), (2, 3)],
+    ]),
+    ("15x15 k=5", 15, 15, 5, 3, [
+        [(7, 7)],
+        [(7, 7), (7, 8), (8, 8), (6, 6)],
+        [(7, 7), (6, 8), (8, 8), (6, 6), (6, 7), (8, 6), (9, 9), (5, 9)],
+    ]),
+]
+
+
+def main():
+    if len(sys.argv) not in [1, 2, 3]:
+        sys.exit("Usage: python benchmark.py [workers] [budget]")
+    workers = int(sys.argv[1]) if len(sys.argv) >= 2 else os.cpu_count()
+    budget = float(sys.argv[2]) if len(sys.argv) == 3 else None
+
+    modes = [("serial", 1)]
+    if workers > 1:
+        modes.append(("parallel", workers))
+
+    print(f"{'suite':<12}{'mode':<10}{'depth':>7}{'nodes':>10}"
+          f"{'nodes/s':>10}{'cutoffs':>10}{'p50 ms':>10}{'max ms':>10}")
+    for name, rows, columns, k, depth, positions in SUITES:
+        boards = [setup(rows, columns, k, moves) for moves in positions]
+        for mode, count in modes:
+            results = measure(boards, count, budget,
+                              None if budget is not None else depth)
+            report(name, mode, results)
+
+
+def setup(rows, columns, k, moves):
+    """
+    Returns a `rows` by `columns` Board won by `k` in a row, with `moves`
+    played on it in turn.
+    """
+    board = Board(rows, columns, k)
+    for i, j in moves:
+        board.make(i * columns + j)
+    if board.winner is not None or board.empty == 0:
+        raise ValueError(f"Position {moves} is already over.")
+    return board
+
+
+def measure(boards, workers, budget, depth):
+    """
+    Searches every board for a move, on `workers` processes, for up to
+    `budget` seconds each or to `depth` moves ahead, returning each
+    search's time to move in seconds and its depth, nodes and cutoffs.
+    """
+    results = []
+    for board in boards:
+        budget = math.inf if budget is None else budget
+        if workers > 1:
+            engine = ParallelEngine(board, budget, workers)
+        else:
+            engine = Engine(board, budget)
+        try:
+            start = time.perf_counter()
+            engine.best_move(depth)
+            elapsed = time.perf_counter() - start
+        finally:
+            if workers > 1:
+                engine.close()
+        results.append((elapsed, engine.depth, engine.nodes, engine.cutoffs))
+    return results
+
+
+def percentile(values, fraction):
+    """
+    Returns the value at `fraction` of the way through sorted `values`.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(name, mode, results):
+    """
+    Prints mean search counters, the overall search rate and time to move
+    percentiles for one suite.
+    """
+    times = [elapsed * 1000 for elapsed, _, _, _ in results]
+    nodes = sum(result[2] for result in results)
+    elapsed = sum(result[0] for result in results)
+
+    def mean(index):
+        return sum(result[index] for result in results) / len(results)
+
+    print(f"{name:<12}{mode:<10}"
+          f"{mean(1):>7.1f}"
+          f"{mean(2):>10.0f}"
+          f"{nodes / elapsed if elapsed > 0 else 0:>10.0f}"
+          f"{mean(3):>10.0f}"
+          f"{percentile(times, 0.5):>10.1f}"
+          f"{max(times):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
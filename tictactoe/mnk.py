@@ -0,0 +1,451 @@
+"""
+Search for m,n,k-games: k in a row on a board of any size
+"""
+
+import multiprocessing
+import random
+import time
+
+# Score of a win; sooner wins score higher
+WIN = 1000000
+
+# Default seconds a move may take
+BUDGET = 1.0
+
+# Slots in the transposition table
+TABLE_SLOTS = 1 << 18
+
+# Boards with more cells only consider moves within REACH of a mark
+SMALL = 25
+REACH = 2
+
+# Kinds of value stored in the transposition table
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Directions a line can run in: across, down, and both diagonals
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+
+# Best score found at the root so far, shared by the processes of a
+# parallel search, and the search each of those processes keeps
+shared = None
+worker = None
+
+
+class Timeout(Exception):
+    pass
+
+
+class Board():
+
+    def __init__(self, rows, columns, k):
+        """
+        Create an empty `rows` by `columns` board won by `k` in a row.
+
+        Cell (i, j) is number i * columns + j, and players are 0 (X, who
+        moves first) and 1 (O). Every stretch of k cells in a line is a
+        window; the board keeps how many marks each player has in each
+        window, and from them a score from X's point of view, updating
+        both as moves are made and unmade.
+        """
+        if not 0 < k <= max(rows, columns):
+            raise ValueError("Win length must fit on the board.")
+        self.rows = rows
+        self.columns = columns
+        self.k = k
+        self.size = rows * columns
+        self.cells = [None] * self.size
+        self.empty = self.size
+        self.turn = 0
+        self.winner = None
+
+        # A window is worth more the more marks it holds, as long as the
+        # other player has none there
+        self.weights = [0] + [4 ** count for count in range(1, k + 1)]
+        self.score = 0
+
+        self.windows_of = [[] for _ in range(self.size)]
+        windows = 0
+        for i in range(rows):
+            for j in range(columns):
+                for di, dj in DIRECTIONS:
+                    if (0 <= i + di * (k - 1) < rows
+                            and 0 <= j + dj * (k - 1) < columns):
+                        for step in range(k):
+                            cell = (i + di * step) * columns + j + dj * step
+                            self.windows_of[cell].append(windows)
+                        windows += 1
+        self.counts = [[0] * windows, [0] * windows]
+
+        # Marks within REACH of each cell, to find moves on large boards
+        self.near = [0] * self.size
+        self.neighbors = [
+            [
+                (i + di) * columns + j + dj
+                for di in range(-REACH, REACH + 1)
+                for dj in range(-REACH, REACH + 1)
+                if (di or dj) and 0 <= i + di < rows
+                and 0 <= j + dj < columns
+            ]
+            for i in range(rows)
+            for j in range(columns)
+        ]
+
+        # Zobrist keys: the hash is the XOR of one key per mark
+        rng = random.Random(0)
+        self.keys = [[rng.getrandbits(64) for _ in range(self.size)]
+                     for _ in range(2)]
+        self.hash = 0
+
+    def place(self, cell, player):
+        """
+        Put `player`'s mark on `cell`, whoever's turn it is, updating
+        the counts, score and winner.
+        """
+        mine = self.counts[player]
+        theirs = self.counts[1 - player]
+        sign = 1 if player == 0 else -1
+        for window in self.windows_of[cell]:
+            count = mine[window]
+            if theirs[window] == 0:
+                self.score += sign * (self.weights[count + 1]
+                                      - self.weights[count])
+            elif count == 0:
+                self.score += sign * self.weights[theirs[window]]
+            mine[window] = count + 1
+            if count + 1 == self.k:
+                self.winner = player
+        for neighbor in self.neighbors[cell]:
+            self.near[neighbor] += 1
+        self.cells[cell] = player
+        self.hash ^= self.keys[player][cell]
+        self.empty -= 1
+
+    def make(self, cell):
+        """
+        Play the current player's mark on `cell`.
+        """
+        self.place(cell, self.turn)
+        self.turn ^= 1
+
+    def unmake(self, cell):
+        """
+        Take back the mark played on `cell` by the last move.
+        """
+        self.turn ^= 1
+        self.remove(cell)
+
+    def remove(self, cell):
+        """
+        Take the mark off `cell`, whoever played it, updating the counts
+        and score and clearing the winner.
+        """
+        player = self.cells[cell]
+        mine = self.counts[player]
+        theirs = self.counts[1 - player]
+        sign = 1 if player == 0 else -1
+        for window in self.windows_of[cell]:
+            mine[window] -= 1
+            count = mine[window]
+            if theirs[window] == 0:
+                self.score -= sign * (self.weights[count + 1]
+                                      - self.weights[count])
+            elif count == 0:
+                self.score -= sign * self.weights[theirs[window]]
+        for neighbor in self.neighbors[cell]:
+            self.near[neighbor] -= 1
+        self.cells[cell] = None
+        self.hash ^= self.keys[player][cell]
+        self.empty += 1
+        self.winner = None
+
+    def candidates(self):
+        """
+        Returns the cells worth considering for the next move: every empty
+        cell on small boards, or else those near a mark, or the centre of
+        an empty board.
+        """
+        if self.size <= SMALL:
+            return [cell for cell in range(self.size)
+                    if self.cells[cell] is None]
+        if self.empty == self.size:
+            return [(self.rows // 2) * self.columns + self.columns // 2]
+        return [cell for cell in range(self.size)
+                if self.cells[cell] is None and self.near[cell]]
+
+    def gain(self, cell):
+        """
+        Returns how much playing `cell` would extend the current player's
+        windows and block the other player's, for ordering moves.
+        """
+        mine = self.counts[self.turn]
+        theirs = self.counts[1 - self.turn]
+        gain = 0
+        for window in self.windows_of[cell]:
+            if theirs[window] == 0:
+                gain += self.weights[mine[window] + 1]
+            if mine[window] == 0:
+                gain += self.weights[theirs[window] + 1]
+        return gain
+
+
+class Engine():
+
+    def __init__(self, board, budget=BUDGET):
+        """
+        Create a searcher for `board` that spends up to `budget` seconds
+        on each move.
+        """
+        self.board = board
+        self.budget = budget
+        self.table = [None] * TABLE_SLOTS
+        self.nodes = 0
+        self.cutoffs = 0
+        self.depth = 0
+        self.deadline = None
+
+    def best_move(self, depth=None):
+        """
+        Returns the best cell for the player to move found by iterative
+        deepening within the time budget, or to `depth` moves ahead if
+        given, and its score for that player.
+        """
+        board = self.board
+        self.deadline = time.perf_counter() + self.budget
+        moves = board.candidates()
+        best = max(moves, key=board.gain)
+        value = 0
+        limit = board.empty if depth is None else min(depth, board.empty)
+        for depth in range(1, limit + 1):
+            try:
+                value = self.negamax(depth, -2 * WIN, 2 * WIN, 0)
+            except Timeout:
+                break
+            entry = self.table[board.hash % TABLE_SLOTS]
+            if entry is not None and entry[0] == board.hash:
+                best = entry[4]
+            self.depth = depth
+
+            # Stop once the result is a forced win or loss
+            if abs(value) > WIN - board.size:
+                break
+        return best, value
+
+    def negamax(self, depth, alpha, beta, ply):
+        """
+        Returns the score of the board for the player to move, searching
+        `depth` moves ahead and scoring positions there heuristically.
+        """
+        board = self.board
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise Timeout
+        if board.winner is not None:
+            return -(WIN - ply)
+        if board.empty == 0:
+            return 0
+        if depth == 0:
+            return board.score if board.turn == 0 else -board.score
+
+        # Reuse what an earlier search found about this position
+        slot = board.hash % TABLE_SLOTS
+        entry = self.table[slot]
+        hint = None
+        if entry is not None and entry[0] == board.hash:
+            _, searched, value, bound, hint = entry
+            if searched >= depth and (
+                bound == EXACT
+                or (bound == LOWER and value >= beta)
+                or (bound == UPPER and value <= alpha)
+            ):
+                return value
+
+        # Try the best move found before first, then the most promising
+        moves = sorted(board.candidates(), key=board.gain, reverse=True)
+        if hint in moves:
+            moves.remove(hint)
+            moves.insert(0, hint)
+
+        low = alpha
+        best = -2 * WIN
+        best_move = moves[0]
+        for cell in moves:
+            board.make(cell)
+            try:
+                value = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake(cell)
+            if value > best:
+                best = value
+                best_move = cell
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                self.cutoffs += 1
+                break
+
+        if best <= low:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table[slot] = (board.hash, depth, best, bound, best_move)
+        return best
+
+
+class ParallelEngine():
+
+    def __init__(self, board, budget=BUDGET, workers=None):
+        """
+        Create a searcher for `board` that splits the moves at the root
+        across a pool of `workers` processes, spending up to `budget`
+        seconds on each move.
+        """
+        self.board = board
+        self.budget = budget
+        self.workers = workers
+        self.alpha = multiprocessing.Value("q", 0)
+        self.pool = multiprocessing.Pool(workers, share, (self.alpha,))
+        self.nodes = 0
+        self.cutoffs = 0
+        self.depth = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+    def best_move(self, depth=None):
+        """
+        Returns the best cell for the player to move found by iterative
+        deepening within the time budget, or to `depth` moves ahead if
+        given, and its score for that player.
+
+        Each iteration searches the best move so far on its own, then the
+        rest in parallel; every worker starts from the best score any
+        worker has reported, so later moves only have to be refuted.
+        """
+        board = self.board
+
+        # Workers each keep their own clock, so they get the wall-clock
+        # time the search must end by
+        deadline = time.time() + self.budget
+        state = (board.rows, board.columns, board.k, board.cells[:],
+                 board.turn)
+        moves = sorted(board.candidates(), key=board.gain, reverse=True)
+        best = moves[0]
+        value = 0
+        limit = board.empty if depth is None else min(depth, board.empty)
+        for depth in range(1, limit + 1):
+            moves.remove(best)
+            moves.insert(0, best)
+
+            # The eldest move is searched with a full window first
+            self.alpha.value = -2 * WIN
+            result = self.pool.apply(search_root,
+                                     ((state, best, depth, deadline),))
+            if not self.count(result):
+                break
+            found, found_value = best, result[1]
+
+            tasks = [(state, cell, depth, deadline) for cell in moves[1:]]
+            finished = True
+            for result in self.pool.imap_unordered(search_root, tasks):
+                if not self.count(result):
+                    finished = False
+                elif result[2] and result[1] > found_value:
+                    found, found_value = result[0], result[1]
+            if not finished:
+                break
+            best, value = found, found_value
+            self.depth = depth
+
+            # Stop once the result is a forced win or loss
+            if abs(value) > WIN - board.size:
+                break
+        return best, value
+
+    def count(self, result):
+        """
+        Adds a root search's counters to the totals, returning whether it
+        finished in time.
+        """
+        cell, value, exact, nodes, cutoffs = result
+        self.nodes += nodes
+        self.cutoffs += cutoffs
+        return value is not None
+
+
+def share(alpha):
+    """
+    Keep the shared root score in a worker process.
+    """
+    global shared
+    shared = alpha
+
+
+def search_root(task):
+    """
+    Returns the cell of a root move, its score searched `depth` moves
+    ahead, whether that score is exact rather than a bound below the
+    shared best, and the nodes and cutoffs searched.
+
+    The score is None if the search ran past `deadline`, a wall-clock time.
+    """
+    (rows, columns, k, cells, turn), cell, depth, deadline = task
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return cell, None, False, 0, 0
+    board = setup(rows, columns, k, cells, turn)
+    nodes, cutoffs = worker.nodes, worker.cutoffs
+    worker.deadline = time.perf_counter() + remaining
+    alpha = shared.value
+    board.make(cell)
+    try:
+        value = -worker.negamax(depth - 1, -2 * WIN, -alpha, 1)
+    except Timeout:
+        value = None
+    finally:
+        board.unmake(cell)
+
+    # Raise the shared score if this move beat it
+    exact = value is not None and value > alpha
+    if exact:
+        with shared.get_lock():
+            if value > shared.value:
+                shared.value = value
+    return (cell, value, exact, worker.nodes - nodes,
+            worker.cutoffs - cutoffs)
+
+
+def setup(rows, columns, k, cells, turn):
+    """
+    Returns this worker's board, changed to hold the marks in `cells` with
+    `turn` to move, keeping the search and its transposition table from
+    earlier moves when the board size is unchanged.
+    """
+    global worker
+    if worker is None or (worker.board.rows, worker.board.columns,
+                          worker.board.k) != (rows, columns, k):
+        worker = Engine(Board(rows, columns, k))
+    board = worker.board
+    for cell, mark in enumerate(cells):
+        if board.cells[cell] != mark:
+            if board.cells[cell] is not None:
+                board.remove(cell)
+            if mark is not None:
+                board.place(cell, mark)
+    board.turn = turn
+    board.winner = None
+    return board
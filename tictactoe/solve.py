@@ -0,0 +1,21 @@
+import sys
+import time
+
+from tictactoe import SOLVED, save_solved, solve
+
+
+def main():
+    if len(sys.argv) not in [1, 2]:
+        sys.exit("Usage: python solve.py [output]")
+    path = sys.argv[1] if len(sys.argv) == 2 else SOLVED
+
+    start = time.perf_counter()
+    table = solve()
+    save_solved(path, table)
+    elapsed = time.perf_counter() - start
+    print(f"Solved {len(table)} positions in {elapsed:.2f}s, "
+          f"written to {path}")
+
+
+if __name__ == "__main__":
+    main()
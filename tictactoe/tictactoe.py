@@ -3,163 +3,516 @@ Tic Tac Toe Player
 """
 
 import math
-from copy import deepcopy
+import os
+from array import array
+from collections import OrderedDict
+
+from mnk import BUDGET, Board, Engine, ParallelEngine
+
 X = "X"
 O = "O"
 EMPTY = None
 
+# Cell (i, j) is bit 3 * i + j of a player's bitboard
+FULL = (1 << 9) - 1
+LINES = [
+    0b000000111, 0b000111000, 0b111000000,
+    0b001001001, 0b010010010, 0b100100100,
+    0b100010001, 0b001010100
+]
+
+# Whether each bitboard holds a line, and the cells set in each bitboard
+WINNING = [any(bits & line == line for line in LINES)
+           for bits in range(1 << 9)]
+CELLS = [[cell for cell in range(9) if bits >> cell & 1]
+         for bits in range(1 << 9)]
+
+# Where each rotation or reflection of the board sends each cell, and
+# each bitboard under each of them
+SYMMETRIES = [
+    [3 * i + j for i in range(3) for j in range(3)],
+    [3 * j + (2 - i) for i in range(3) for j in range(3)],
+    [3 * (2 - i) + (2 - j) for i in range(3) for j in range(3)],
+    [3 * (2 - j) + i for i in range(3) for j in range(3)],
+    [3 * i + (2 - j) for i in range(3) for j in range(3)],
+    [3 * (2 - i) + j for i in range(3) for j in range(3)],
+    [3 * j + i for i in range(3) for j in range(3)],
+    [3 * (2 - j) + (2 - i) for i in range(3) for j in range(3)],
+]
+TRANSFORMED = [
+    [sum(1 << symmetry[cell] for cell in CELLS[bits])
+     for bits in range(1 << 9)]
+    for symmetry in SYMMETRIES
+]
+
+# Kinds of value stored in the transposition table
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Most positions the transposition table keeps
+TABLE_SIZE = 4096
+
+# File of solved positions written by solve.py, and how it starts
+SOLVED = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      "tictactoe.solved")
+SOLVED_MAGIC = b"TTTSOLV1"
+
+
+class Position():
+
+    def __init__(self, board=None):
+        """
+        Create a bitboard position from a list-of-lists `board`,
+        or an empty one.
+        """
+        # bits[0] holds X's cells and bits[1] O's; turn is 0 for X
+        self.bits = [0, 0]
+        if board is not None:
+            for i in range(3):
+                for j in range(3):
+                    if board[i][j] == X:
+                        self.bits[0] |= 1 << (3 * i + j)
+                    elif board[i][j] == O:
+                        self.bits[1] |= 1 << (3 * i + j)
+        self.turn = 0 if (len(CELLS[self.bits[0]])
+                          == len(CELLS[self.bits[1]])) else 1
+
+    def make(self, cell):
+        """
+        Play the current player's mark on `cell`.
+        """
+        self.bits[self.turn] |= 1 << cell
+        self.turn ^= 1
+
+    def unmake(self, cell):
+        """
+        Take back the mark played on `cell` by the last move.
+        """
+        self.turn ^= 1
+        self.bits[self.turn] ^= 1 << cell
+
+    def moves(self):
+        """
+        Returns the empty cells, in order.
+        """
+        return CELLS[FULL & ~(self.bits[0] | self.bits[1])]
+
+    def winner(self):
+        """
+        Returns X or O if they have a line, or None.
+        """
+        if WINNING[self.bits[0]]:
+            return X
+        elif WINNING[self.bits[1]]:
+            return O
+        return None
+
+    def terminal(self):
+        """
+        Returns True if someone has a line or the board is full.
+        """
+        return (WINNING[self.bits[0]] or WINNING[self.bits[1]]
+                or self.bits[0] | self.bits[1] == FULL)
+
+    def utility(self):
+        """
+        Returns 1 if X has won, -1 if O has won, 0 otherwise.
+        """
+        if WINNING[self.bits[0]]:
+            return 1
+        elif WINNING[self.bits[1]]:
+            return -1
+        return 0
+
+    def key(self):
+        """
+        Returns a number identifying the position up to rotation and
+        reflection: the smallest encoding of any of its symmetries.
+        """
+        x, o = self.bits
+        return min(
+            transformed[x] | transformed[o] << 9
+            for transformed in TRANSFORMED
+        )
 
-def initial_state():
+    def canonical(self):
+        """
+        Returns the position's key and the index of the symmetry in
+        SYMMETRIES that turns the position into the one the key encodes.
+        """
+        x, o = self.bits
+        return min(
+            (transformed[x] | transformed[o] << 9, symmetry)
+            for symmetry, transformed in enumerate(TRANSFORMED)
+        )
+
+    def board(self):
+        """
+        Returns the position as a list-of-lists board.
+        """
+        return [
+            [X if self.bits[0] >> (3 * i + j) & 1
+             else O if self.bits[1] >> (3 * i + j) & 1
+             else EMPTY
+             for j in range(3)]
+            for i in range(3)
+        ]
+
+
+class TranspositionTable():
+
+    def __init__(self, size):
+        """
+        Create an empty table keeping at most `size` positions, evicting
+        the least recently used first.
+        """
+        self.size = size
+        self.entries = OrderedDict()
+
+    def probe(self, key, alpha, beta):
+        """
+        Returns the stored value of position `key` if it settles a search
+        with window (alpha, beta), or None.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        value, bound = entry
+        if (bound == EXACT or (bound == LOWER and value >= beta)
+                or (bound == UPPER and value <= alpha)):
+            return value
+        return None
+
+    def store(self, key, value, alpha, beta):
+        """
+        Store the value `value` found for position `key` by a search with
+        window (alpha, beta), noting whether it is exact or a bound.
+        """
+        if value <= alpha:
+            bound = UPPER
+        elif value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.entries[key] = (value, bound)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+# Positions searched so far, shared by every search in the game
+table = TranspositionTable(TABLE_SIZE)
+
+# Best moves of solved positions by canonical key, loaded when first needed
+solved = None
+
+# Search of larger boards, kept from move to move of a game so its
+# transposition tables, and any worker processes, carry over
+engine = None
+
+
+def initial_state(rows=3, columns=3):
     """
     Returns starting state of the board.
     """
-    return [[EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY]]
+    return [[EMPTY] * columns for _ in range(rows)]
 
 
 def player(board):
     """
     Returns player who has the next turn on a board.
     """
-    cx = 0
-    co = 0
-    for i in board:
-        for j in i:
-            if j == X:
-                cx += 1
-            elif j == O:
-                co += 1
-            else:
-                pass
-    if cx == co:
-        return X
-    else:
-        return O
+    marks = [cell for row in board for cell in row]
+    return X if marks.count(X) == marks.count(O) else O
 
 
 def actions(board):
     """
     Returns set of all possible actions (i, j) available on the board.
     """
-    actionz = set()
-    for i in range(len(board)):
-        for j in range(len(board[i])):
-            if board[i][j] is EMPTY:
-                actionz.add((i, j))
-    return actionz
+    return {
+        (i, j)
+        for i in range(len(board))
+        for j in range(len(board[i]))
+        if board[i][j] is EMPTY
+    }
 
 
 def result(board, action):
     """
     Returns the board that results from making move (i, j) on the board.
     """
-    if board[action[0]][action[1]] is not EMPTY:
+    i, j = action
+    if (not (0 <= i < len(board) and 0 <= j < len(board[i]))
+            or board[i][j] is not EMPTY):
         raise Exception('Invalid move')
-    p = player(board)
-    new_board = deepcopy(board)
-    new_board[action[0]][action[1]] = p
+    new_board = [row[:] for row in board]
+    new_board[i][j] = player(board)
     return new_board
 
 
-def winner(board):
+def winner(board, k=3):
     """
     Returns the winner of the game, if there is one.
     """
-    b = board
-    if b[0][0] == b[0][1] == b[0][2] == X or b[1][0] == b[1][1] == b[1][2] == X or b[2][0] == b[2][1] == b[2][2] == X or b[0][0] == b[1][0] == b[2][0] == X or b[0][1] == b[1][1] == b[2][1] == X or b[0][2] == b[1][2] == b[2][2] == X or b[0][0] == b[1][1] == b[2][2] == X or b[0][2] == b[1][1] == b[2][0] == X:
-        return X
-    elif b[0][0] == b[0][1] == b[0][2] == O or b[1][0] == b[1][1] == b[1][2] == O or b[2][0] == b[2][1] == b[2][2] == O or b[0][0] == b[1][0] == b[2][0] == O or b[0][1] == b[1][1] == b[2][1] == O or b[0][2] == b[1][2] == b[2][2] == O or b[0][0] == b[1][1] == b[2][2] == O or b[0][2] == b[1][1] == b[2][0] == O:
-        return O
-    else:
-        return None
+    if classic(board, k):
+        return Position(board).winner()
+    return {0: X, 1: O}.get(grid(board, k).winner)
 
 
-def terminal(board):
+def terminal(board, k=3):
     """
     Returns True if game is over, False otherwise.
     """
-    b = board
-    if b[0][0] == b[0][1] == b[0][2] != EMPTY or b[1][0] == b[1][1] == b[1][2] != EMPTY or b[2][0] == b[2][1] == b[2][2] != EMPTY or b[0][0] == b[1][0] == b[2][0] != EMPTY or b[0][1] == b[1][1] == b[2][1] != EMPTY or b[0][2] == b[1][2] == b[2][2] != EMPTY or b[0][0] == b[1][1] == b[2][2] != EMPTY or b[0][2] == b[1][1] == b[2][0] != EMPTY:
-        return True
-    for i in b:
-        for j in i:
-            if j == EMPTY:
-                return False
-    return True
+    if classic(board, k):
+        return Position(board).terminal()
+    position = grid(board, k)
+    return position.winner is not None or position.empty == 0
 
 
-def utility(board):
+def utility(board, k=3):
     """
     Returns 1 if X has won the game, -1 if O has won, 0 otherwise.
     """
-    val = winner(board)
-    if val == X:
-        return 1
-    elif val == O:
-        return -1
-    else:
-        return 0
+    if classic(board, k):
+        return Position(board).utility()
+    return {0: 1, 1: -1}.get(grid(board, k).winner, 0)
 
 
-def max_value(board, alpha, beta):
+def classic(board, k):
+    """
+    Returns True if `board` is 3x3 and won by three in a row, the game
+    the bitboards and solved table cover.
+    """
+    return k == 3 and len(board) == 3 and all(len(row) == 3 for row in board)
+
+
+def grid(board, k):
+    """
+    Returns a list-of-lists `board` won by `k` in a row as an mnk Board.
+    """
+    position = Board(len(board), len(board[0]), k)
+    for i, row in enumerate(board):
+        for j, mark in enumerate(row):
+            if mark is not EMPTY:
+                position.place(i * position.columns + j, 0 if mark == X else 1)
+    position.turn = 0 if player(board) == X else 1
+    position.winner = (0 if k in position.counts[0]
+                       else 1 if k in position.counts[1] else None)
+    return position
+
+
+def max_value(position, alpha, beta):
     '''
-    calculates max_values, takes board state, alpha and beta values as parameter
+    calculates max_values, takes a Position with X to move, alpha and beta
+    values as parameter; the position is restored before returning
     '''
-    if terminal(board):
-        return utility(board)
+    if position.terminal():
+        return position.utility()
+    key = position.key()
+    v = table.probe(key, alpha, beta)
+    if v is not None:
+        return v
 
     v = -2
-    for a in actions(board):
-        v1 = min_value(result(board, a), alpha, beta)
+    low = alpha
+    for cell in position.moves():
+        position.make(cell)
+        v1 = min_value(position, alpha, beta)
+        position.unmake(cell)
         if v1 > v:
             v = v1
         if v1 >= beta:
-            return v
+            break
         if v1 > alpha:
             alpha = v1
+    table.store(key, v, low, beta)
     return v
 
 
-def min_value(board, alpha, beta):
+def min_value(position, alpha, beta):
     '''
-    calculates min_values, takes board state, alpha and beta values as parameter
+    calculates min_values, takes a Position with O to move, alpha and beta
+    values as parameter; the position is restored before returning
     '''
-    if terminal(board):
-        return utility(board)
+    if position.terminal():
+        return position.utility()
+    key = position.key()
+    v = table.probe(key, alpha, beta)
+    if v is not None:
+        return v
+
     v = 2
-    for a in actions(board):
-        v1 = max_value(result(board, a), alpha, beta)
+    high = beta
+    for cell in position.moves():
+        position.make(cell)
+        v1 = max_value(position, alpha, beta)
+        position.unmake(cell)
         if v1 < v:
             v = v1
         if v1 <= alpha:
-            return v
+            break
         if v1 < beta:
             beta = v1
+    table.store(key, v, alpha, high)
     return v
 
 
-def minimax(board):
+def minimax(board, k=3, budget=BUDGET, workers=1):
     """
     Returns the optimal action for the current player on the board.
+
+    Boards other than 3x3 with three in a row are searched by iterative
+    deepening for up to `budget` seconds, so the action is the best
+    found in that time; with more than one worker, the actions are split
+    across that many processes.
     """
-    if terminal(board):
+    if not classic(board, k):
+        position = grid(board, k)
+        if position.winner is not None or position.empty == 0:
+            return None
+        cell, _ = searcher(position, budget, workers).best_move()
+        return divmod(cell, position.columns)
+
+    position = Position(board)
+    if position.terminal():
         return None
 
-    if player(board) == X:
+    # Solved positions are answered without searching
+    cell = solved_move(position)
+    if cell is None:
+        _, cell = search(position)
+    return divmod(cell, 3)
+
+
+def searcher(position, budget, workers):
+    """
+    Returns a search of an mnk Board `position` for up to `budget` seconds
+    a move on `workers` processes, reusing the previous move's search
+    while the board size, win length and workers are unchanged.
+    """
+    global engine
+    kind = ParallelEngine if workers > 1 else Engine
+    if engine is not None:
+        board = engine.board
+        if (not isinstance(engine, kind)
+                or (board.rows, board.columns, board.k)
+                != (position.rows, position.columns, position.k)
+                or (kind is ParallelEngine and engine.workers != workers)):
+            if isinstance(engine, ParallelEngine):
+                engine.close()
+            engine = None
+    if engine is None:
+        if kind is ParallelEngine:
+            engine = ParallelEngine(position, budget, workers)
+        else:
+            engine = Engine(position, budget)
+
+    # The same board size has the same Zobrist keys, so stored positions
+    # still match
+    engine.board = position
+    engine.budget = budget
+    return engine
+
+
+def search(position):
+    """
+    Returns the value of a Position that is not over and the cell of the
+    first move reaching it.
+    """
+    # A later move must beat the best so far, so the window can narrow
+    best = None
+    if position.turn == 0:
         v = -2
-        for a in actions(board):
-            val = min_value(result(board, a), -2, 2)
+        for cell in position.moves():
+            position.make(cell)
+            val = min_value(position, v, 2)
+            position.unmake(cell)
             if val > v:
                 v = val
-                action = a
+                best = cell
     else:
         v = 2
-        for a in actions(board):
-            val = max_value(result(board, a), -2, 2)
+        for cell in position.moves():
+            position.make(cell)
+            val = max_value(position, -2, v)
+            position.unmake(cell)
             if val < v:
                 v = val
-                action = a
+                best = cell
+    return v, best
 
-    return action
 
+def solved_move(position):
+    """
+    Returns the best move for a Position from the solved table, loading
+    it the first time, or None if the position is not in it.
+    """
+    global solved
+    if solved is None:
+        solved = load_solved(SOLVED)
+    key, symmetry = position.canonical()
+    entry = solved.get(key)
+    if entry is None:
+        return None
+
+    # The table's move is for the canonical orientation of the board
+    return SYMMETRIES[symmetry].index(entry & 0xF)
+
+
+def solve():
+    """
+    Returns a dictionary mapping the canonical key of every reachable
+    position that is not over to its best move in that orientation, in
+    the low 4 bits, and its value plus one, in the bits above.
+    """
+    table = dict()
+    position = Position()
+
+    def visit():
+        if position.terminal():
+            return
+        key, symmetry = position.canonical()
+        if key in table:
+            return
+        value, cell = search(position)
+        table[key] = SYMMETRIES[symmetry][cell] | (value + 1) << 4
+        for cell in position.moves():
+            position.make(cell)
+            visit()
+            position.unmake(cell)
+
+    visit()
+    return table
+
+
+def save_solved(path, table):
+    """
+    Write a solved table to `path` as its keys, sorted, then their entries.
+    """
+    keys = sorted(table)
+    with open(path, "wb") as f:
+        f.write(SOLVED_MAGIC)
+        f.write(array("I", keys).tobytes())
+        f.write(bytes(table[key] for key in keys))
+
+
+def load_solved(path):
+    """
+    Returns the solved table saved at `path`, or an empty dictionary if
+    there is no usable one.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return dict()
+    count = (len(data) - len(SOLVED_MAGIC)) // 5
+    if (not data.startswith(SOLVED_MAGIC)
+            or len(SOLVED_MAGIC) + 5 * count != len(data)):
+        return dict()
+    keys = array("I")
+    keys.frombytes(data[len(SOLVED_MAGIC):len(SOLVED_MAGIC) + 4 * count])
+    return dict(zip(keys, data[len(SOLVED_MAGIC) + 4 * count:]))